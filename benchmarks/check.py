@@ -0,0 +1,67 @@
+# builds the examples and a generated program with every report turned on, in every format, to catch reports which
+# crash. Nothing is compared, a build passes if it finishes.
+# usage: python benchmarks/check.py
+
+import contextlib
+import io
+import os
+import shutil
+import sys
+import tempfile
+import traceback
+
+ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..')
+sys.path.insert(0, ROOT)
+
+from datapack.compiler import compile
+from datapack.interpreter import Simulation
+from datapack.profile import Profiler
+
+from generate import write_program
+
+# the report files written by each build, in each of their formats
+REPORTS = [('cost.txt', 'graph.json'), ('cost.json', 'graph.dot')]
+
+
+# builds <main> once for each entry of REPORTS, and returns the number of builds which failed
+def check(main, folder):
+
+    failed = 0
+    for cost, graph in REPORTS:
+        destination = os.path.join(folder, 'check')
+        shutil.rmtree(destination, ignore_errors=True)
+        profiler = Profiler()
+        simulation = Simulation(ticks=2)
+        try:
+            with contextlib.redirect_stdout(io.StringIO()):
+                compile(destination, [main], zip=True, profiler=profiler, callgraph=os.path.join(folder, graph),
+                        costreport=os.path.join(folder, cost), simulation=simulation)
+                profiler.to_text()
+                profiler.to_json()
+                simulation.to_text()
+        except Exception:
+            print('%s with %s, %s:' % (os.path.relpath(main), cost, graph))
+            traceback.print_exc()
+            failed += 1
+    return failed
+
+
+def main():
+
+    folder = tempfile.mkdtemp(prefix='datapack-check-')
+    try:
+        examples = os.path.join(ROOT, 'examples')
+        programs = [os.path.join(examples, name) for name in sorted(os.listdir(examples)) if name.endswith('.mcf')]
+        programs.append(write_program(os.path.join(folder, 'src'), defs=20))
+
+        failed = sum(check(program, folder) for program in programs)
+    finally:
+        shutil.rmtree(folder, ignore_errors=True)
+
+    print('%i builds, %i failed' % (len(programs) * len(REPORTS), failed))
+    if failed:
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,127 @@
+# measures whole builds of synthetic programs, made by generate.py, each stressing one part of the compiler.
+# usage: python benchmarks/compile.py [--configs base defs ...] [--repeat 3] [--update]
+#
+# results are compared with baseline.json, next to this file. --update rewrites it with the new results, so that a
+# change in performance shows up in its diff. Times and memory depend on the machine, output counts don't.
+
+import argparse
+import contextlib
+import io
+import json
+import os
+import shutil
+import sys
+import tempfile
+import time
+import tracemalloc
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+from datapack.compiler import compile
+from datapack.profile import Profiler
+
+from generate import write_program
+
+BASELINE = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'baseline.json')
+
+# the programs to build, each changing one setting of generate.DEFAULTS
+CONFIGS = {
+    'base': {},
+    'defs': {'defs': 1000},
+    'depth': {'depth': 12},
+    'fanout': {'fanout': 400},
+    'ints': {'ints': 40},
+    'loops': {'loops': 1.0},
+    'includes': {'includes': 50},
+}
+
+
+# builds <main> into <destination>, and returns the Profiler of the build
+def build(main, destination):
+
+    # tracemalloc slows the build down, and measure uses it on its own
+    profiler = Profiler(memory=False)
+    with contextlib.redirect_stdout(io.StringIO()):
+        compile(destination, [main], profiler=profiler)
+    return profiler
+
+
+# builds the program of <config> <repeat> times, and returns its results. Times are from the fastest build, peak
+# memory is measured with tracemalloc in one more build, as tracing slows building down.
+def measure(config, repeat):
+
+    folder = tempfile.mkdtemp(prefix='datapack-bench-')
+    try:
+        main = write_program(os.path.join(folder, 'src'), **CONFIGS[config])
+        destination = os.path.join(folder, 'bench')
+
+        best = None
+        for i in range(repeat):
+            shutil.rmtree(destination, ignore_errors=True)
+            start = time.perf_counter()
+            profiler = build(main, destination)
+            elapsed = time.perf_counter() - start
+            if best is None or elapsed < best[0]:
+                best = (elapsed, profiler)
+
+        shutil.rmtree(destination, ignore_errors=True)
+        tracemalloc.start()
+        build(main, destination)
+        peak = tracemalloc.get_traced_memory()[1]
+        tracemalloc.stop()
+
+        files = sum(len(names) for path, dirs, names in os.walk(destination))
+    finally:
+        shutil.rmtree(folder, ignore_errors=True)
+
+    elapsed, profiler = best
+    return {
+        'seconds': round(elapsed, 4),
+        'phases': {phase: round(seconds, 4) for phase, seconds, memory in profiler.timings()},
+        'peak_memory': peak,
+        'files': files,
+    }
+
+
+# returns a change from <old> to <new> as a percentage, or '' if there is nothing to compare with
+def change(old, new):
+
+    if not old:
+        return ''
+    return '%+.0f%%' % ((new - old) * 100.0 / old)
+
+
+def main():
+
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--configs', nargs='+', choices=list(CONFIGS), default=list(CONFIGS))
+    parser.add_argument('--repeat', type=int, default=3)
+    parser.add_argument('--update', action='store_true', help='save the results as the new baseline')
+    args = parser.parse_args()
+
+    baseline = {}
+    if os.path.isfile(BASELINE):
+        with open(BASELINE) as f:
+            baseline = json.load(f)
+
+    print('%-10s %10s %8s %12s %8s %8s %8s' % ('config', 'seconds', '', 'peak MB', '', 'files', ''))
+
+    results = dict(baseline)
+    for config in args.configs:
+        result = results[config] = measure(config, args.repeat)
+        old = baseline.get(config, {})
+        # the number of files doesn't depend on the machine, so any change is shown
+        files = '' if old.get('files', result['files']) == result['files'] else 'was %i' % old['files']
+        print('%-10s %10.3f %8s %12.1f %8s %8i %8s' % (
+            config, result['seconds'], change(old.get('seconds'), result['seconds']),
+            result['peak_memory'] / 2 ** 20, change(old.get('peak_memory'), result['peak_memory']),
+            result['files'], files))
+
+    if args.update:
+        with open(BASELINE, 'w') as f:
+            json.dump(results, f, indent=4, sort_keys=True)
+            f.write('\n')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,127 @@
+# generates synthetic EasyDatapacks programs for benchmarking the compiler.
+# usage: python benchmarks/generate.py <output folder> [--defs 200] [--depth 2] [--fanout 10] [--ints 4]
+#        [--loops 0.3] [--includes 2] [--seed 0]
+
+import argparse
+import os
+import random
+
+# the settings of a program, see generate
+DEFAULTS = {'defs': 200, 'depth': 2, 'fanout': 10, 'ints': 4, 'loops': 0.3, 'includes': 2, 'seed': 0}
+
+# the blocks used for nesting, the innermost one last
+BLOCKS = ['as @e[type=pig,distance=..%i] at @s:', 'if entity @a[distance=..%i]:', 'positioned ~ ~%i ~:']
+
+
+# returns the name of the top-level def number <i>. Function names can only have letters, so its digits are spelled
+# with the letters a to j.
+def def_name(i):
+    return 'f' + ''.join(chr(ord('a') + int(c)) for c in str(i))
+
+
+# returns the lines of the top-level def number <i>
+def generate_def(i, depth, fanout, ints, loops, rng):
+
+    lines = ['def %s p#p:' % def_name(i)]
+
+    # integer variables, each one worked out from the one before it
+    for v in range(ints):
+        if v == 0:
+            lines.append('    v0 = %i' % i)
+        else:
+            lines.append('    v%i = v%i' % (v, v - 1))
+            lines.append('    v%i %s %i' % (v, rng.choice(['+=', '-=', '*=']), rng.randint(1, 9)))
+    if ints > 0:
+        lines.append('    tellraw p [{"text":"%s "},v%i#t]' % (def_name(i), ints - 1))
+
+    # nested blocks, calling the string function and the def before this one at the innermost level
+    indent = '    '
+    for level in range(depth):
+        lines.append(indent + BLOCKS[level % len(BLOCKS)] % (level + 1))
+        indent += '    '
+    lines.append(indent + 'show "message %i"' % (i % max(fanout, 1)))
+    if i > 0:
+        lines.append(indent + def_name(i - 1) + ' p')
+
+    # a loop with break and continue
+    if rng.random() < loops:
+        lines.append('    n = 0')
+        lines.append('    while n < 10:')
+        lines.append('        n += 1')
+        lines.append('        if n == 3:')
+        lines.append('            continue')
+        lines.append('        if n == %i:' % rng.randint(4, 9))
+        lines.append('            break')
+        lines.append('        say looping')
+
+    return lines
+
+
+# returns a program as {file name : contents}, the main file being main.mcf. It has <defs> top-level defs, each
+# calling the one before it from inside <depth> nested blocks, and <ints> integer variables. Every def calls a string
+# function with one of <fanout> different strings, so linking makes that many clones of it. <loops> is the share of
+# defs with a while loop using break and continue. The defs are spread over main.mcf and <includes> files which it
+# includes. <seed> makes the choices along the way repeatable.
+def generate(defs, depth, fanout, ints, loops, includes, seed):
+
+    rng = random.Random(seed)
+    files = {'main.mcf': ['packname#s = "bench"'] + ['include part%i.mcf' % k for k in range(includes)]}
+    for k in range(includes):
+        files['part%i.mcf' % k] = []
+
+    files['main.mcf'].append('def show msg#s:')
+    files['main.mcf'].append('    tellraw @a [{"text":packname},msg]')
+    # long enough not to be inlined, so that every clone is written out
+    files['main.mcf'].append('    say msg')
+    files['main.mcf'].append('    title @a actionbar [msg]')
+    files['main.mcf'].append('    playsound minecraft:block.note_block.pling master @a')
+
+    for i in range(defs):
+        k = i % (includes + 1)
+        name = 'main.mcf' if k == includes else 'part%i.mcf' % k
+        files[name].extend(generate_def(i, depth, fanout, ints, loops, rng))
+
+    files['main.mcf'].append('def load:')
+    files['main.mcf'].append('    say loaded')
+    files['main.mcf'].append('def tick:')
+    if defs > 0:
+        files['main.mcf'].append('    %s @a' % def_name(defs - 1))
+    else:
+        files['main.mcf'].append('    say tick')
+
+    return {name: '\n'.join(lines) + '\n' for name, lines in files.items()}
+
+
+# writes the program made by generate to the folder <path>, and returns the path of its main file
+def write_program(path, **settings):
+
+    options = dict(DEFAULTS)
+    options.update(settings)
+
+    if not os.path.isdir(path):
+        os.makedirs(path)
+    for name, text in generate(**options).items():
+        with open(os.path.join(path, name), 'w') as f:
+            f.write(text)
+    return os.path.join(path, 'main.mcf')
+
+
+def main():
+
+    parser = argparse.ArgumentParser()
+    parser.add_argument('output')
+    parser.add_argument('--defs', type=int, default=DEFAULTS['defs'])
+    parser.add_argument('--depth', type=int, default=DEFAULTS['depth'])
+    parser.add_argument('--fanout', type=int, default=DEFAULTS['fanout'])
+    parser.add_argument('--ints', type=int, default=DEFAULTS['ints'])
+    parser.add_argument('--loops', type=float, default=DEFAULTS['loops'])
+    parser.add_argument('--includes', type=int, default=DEFAULTS['includes'])
+    parser.add_argument('--seed', type=int, default=DEFAULTS['seed'])
+    args = parser.parse_args()
+
+    settings = {key: getattr(args, key) for key in DEFAULTS}
+    print(write_program(args.output, **settings))
+
+
+if __name__ == '__main__':
+    main()
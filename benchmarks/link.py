@@ -0,0 +1,59 @@
+# measures how the link (post-processing) pass of Namespace.compile scales with the number of functions.
+# usage: python benchmarks/link.py [--sizes 1000 5000 10000 25000 50000]
+
+import argparse
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+from datapack.namespace import Namespace
+from datapack.function import Function
+from datapack.scope import SymbolTable
+
+# a string function, so that linking also has to instantiate functions mid-pass
+LINES = [(0, 'def show msg#s:', 1), (1, 'say msg', 2), (1, 'say done', 3)]
+
+
+# build an unlinked namespace holding <size> generated functions, each calling the next, with one in ten calling
+# the string function "show".
+def synthetic_namespace(size):
+
+    namespace = Namespace('bench', [])
+    namespace.add_function(Function(['main', 'show'], SymbolTable(), {'msg': 's'}, {}, LINES, namespace, 1, 1,
+                                    ['main', 'show'], None, {}))
+
+    for i in range(size):
+        func = Function(['main', 'f' + str(i)], SymbolTable(), {}, {}, [], namespace, 0, 0, ['main', 'f' + str(i)], None, {})
+        func.commands = ['say ' + str(i), 'scoreboard players add @s bench 1']
+        if i + 1 < size:
+            func.commands.append('execute as @s run !f{main.f' + str(i + 1) + '}')
+        if i % 10 == 0:
+            func.commands.append('!f{main.show}{' + str(i % 100) + '}')
+        namespace.add_function(func)
+
+    return namespace
+
+
+def main():
+
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--sizes', type=int, nargs='+', default=[1000, 5000, 10000, 25000, 50000])
+    args = parser.parse_args()
+
+    print('%10s %10s %12s %14s' % ('functions', 'commands', 'seconds', 'us/function'))
+
+    for size in args.sizes:
+        namespace = synthetic_namespace(size)
+        commands = sum(len(f.commands) for f in namespace.functions.values())
+
+        start = time.perf_counter()
+        namespace.link(False)
+        elapsed = time.perf_counter() - start
+
+        print('%10i %10i %12.3f %14.2f' % (size, commands, elapsed, elapsed * 1e6 / size))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,123 @@
+import json
+import re
+
+
+# the calls between the functions of a linked namespace. Every "function <pack>:<name>" in a command is an edge,
+# this covers plain calls, "execute ... run function" and the self-calls of loops. Commands which were commented out
+# because they called an empty function are skipped.
+class CallGraph:
+
+    def __init__(self, namespace, roots):
+
+        self.pack = namespace.pack
+
+        # an entry follows this format: {Function.name : [called Function.name, ...]}, in order of first call
+        self.calls = {}
+
+        self.pattern = re.compile(r'function ' + re.escape(namespace.pack) + r':([^\s"\'\]}]+)')
+        for name, func in namespace.functions.items():
+            callees = []
+            for command in func.commands:
+                if command.startswith('#') or 'function ' not in command:
+                    continue
+                for callee in self.callees(command):
+                    if callee in namespace.functions and callee not in callees:
+                        callees.append(callee)
+            self.calls[name] = callees
+
+        # functions with no commands are never called, they are commented out instead
+        self.roots = [r for r in roots if r in namespace.functions and len(namespace.functions[r].commands) > 0]
+        self.roots = list(dict.fromkeys(self.roots))
+
+        # every function which can be reached from a root, in the order it was reached
+        self.reachable = {}
+        stack = list(reversed(self.roots))
+        while stack:
+            name = stack.pop()
+            if name in self.reachable:
+                continue
+            self.reachable[name] = True
+            stack.extend(reversed(self.calls[name]))
+
+        self.removed = [name for name in self.calls if name not in self.reachable]
+
+    # returns the name of every function called in <command>, hidden functions are in a subfolder named after their def
+    def callees(self, command):
+        return ['main.' + match.group(1).split('/')[-1] for match in self.pattern.finditer(command)]
+
+    # returns the strongly connected components of the graph, callees before their callers. A function is recursive
+    # if its component has more than one function, or if it calls itself.
+    def components(self):
+
+        index = {}
+        low = {}
+        stack = []
+        onstack = set()
+        components = []
+
+        for start in self.calls:
+            if start in index:
+                continue
+
+            # depth-first search without recursion, as deep call chains would exceed Python's recursion limit
+            work = [(start, 0)]
+            while work:
+                name, i = work.pop()
+                if i == 0:
+                    index[name] = low[name] = len(index)
+                    stack.append(name)
+                    onstack.add(name)
+                callees = self.calls[name]
+                if i < len(callees):
+                    work.append((name, i + 1))
+                    callee = callees[i]
+                    if callee not in index:
+                        work.append((callee, 0))
+                    elif callee in onstack:
+                        low[name] = min(low[name], index[callee])
+                    continue
+
+                if work:
+                    caller = work[-1][0]
+                    low[caller] = min(low[caller], low[name])
+                if low[name] == index[name]:
+                    component = []
+                    while True:
+                        f = stack.pop()
+                        onstack.discard(f)
+                        component.append(f)
+                        if f == name:
+                            break
+                    components.append(component)
+
+        return components
+
+    def to_dot(self):
+
+        out = ['digraph "' + self.pack + '" {']
+        for name in self.roots:
+            out.append('    "%s" [shape=box];' % name[5:])
+        for name in self.reachable:
+            for callee in self.calls[name]:
+                out.append('    "%s" -> "%s";' % (name[5:], callee[5:]))
+        out.append('}')
+        return '\n'.join(out) + '\n'
+
+    def to_json(self):
+
+        graph = {
+            'pack': self.pack,
+            'roots': [name[5:] for name in self.roots],
+            'functions': {name[5:]: [callee[5:] for callee in self.calls[name]] for name in self.reachable},
+            'removed': [name[5:] for name in self.removed],
+        }
+        return json.dumps(graph, indent=4) + '\n'
+
+    # writes the graph to <path>, as DOT if it ends with .dot or .gv, otherwise as JSON
+    def write(self, path):
+
+        with open(path, 'w') as f:
+            if path.endswith('.dot') or path.endswith('.gv'):
+                f.write(self.to_dot())
+            else:
+                f.write(self.to_json())
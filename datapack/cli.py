@@ -1,9 +1,31 @@
 import sys
 import argparse
 import os
-import time
 
 from .compiler import *
+from .watcher import *
+
+
+# an argparse type for counts which must be at least 1
+def positive_int(text):
+    try:
+        value = int(text)
+    except ValueError:
+        raise argparse.ArgumentTypeError(f"invalid int value: {text!r}")
+    if value < 1:
+        raise argparse.ArgumentTypeError(f"must be at least 1, not {value}")
+    return value
+
+
+# an argparse type for durations which can't be negative
+def non_negative_float(text):
+    try:
+        value = float(text)
+    except ValueError:
+        raise argparse.ArgumentTypeError(f"invalid float value: {text!r}")
+    if not value >= 0:
+        raise argparse.ArgumentTypeError(f"must be at least 0, not {value}")
+    return value
 
 
 parser = argparse.ArgumentParser(prog="datapack")
@@ -17,6 +39,19 @@ buildlike_parser.add_argument(
 buildlike_parser.add_argument(
     "-z", "--zip", action="store_true", help="zip the output folder."
 )
+buildlike_parser.add_argument(
+    "--zip-only",
+    action="store_true",
+    help="only create the zipped datapack, without the output folder.",
+)
+buildlike_parser.add_argument(
+    "--compression-level",
+    type=int,
+    choices=range(10),
+    default=None,
+    metavar="0-9",
+    help="the compression level of the zipped datapack, 0 stores files uncompressed.",
+)
 buildlike_parser.add_argument(
     "-H", "--hide", action="store_true", help="hide all non-base functions in a subfolder."
 )
@@ -34,6 +69,117 @@ buildlike_parser.add_argument(
     action="store",
     help="the output directory, defaults to the name of the first file provided",
 )
+buildlike_parser.add_argument(
+    "--lazy",
+    action="store_true",
+    help="only compile functions which can be reached from load, tick or an exported function.",
+)
+buildlike_parser.add_argument(
+    "--export",
+    default=[],
+    action="append",
+    metavar="FUNCTION",
+    help="with --lazy, also compile this function and everything it calls. Can be given more than once.",
+)
+buildlike_parser.add_argument(
+    "--call-graph",
+    default=None,
+    metavar="FILE",
+    help="write the calls between the generated functions to FILE, as DOT if it ends with .dot, otherwise JSON.",
+)
+buildlike_parser.add_argument(
+    "--cost-report",
+    default=None,
+    metavar="FILE",
+    help="write what each generated function costs to run, and the worst case of the tick function, to FILE. "
+    "As JSON if it ends with .json, otherwise as a table.",
+)
+buildlike_parser.add_argument(
+    "--inline-threshold",
+    type=int,
+    default=INLINE_THRESHOLD,
+    metavar="N",
+    help="inline calls to functions of at most N commands, 1 only inlines single commands. Defaults to %i."
+    % INLINE_THRESHOLD,
+)
+buildlike_parser.add_argument(
+    "--inline-budget",
+    type=int,
+    default=INLINE_BUDGET,
+    metavar="N",
+    help="the most commands inlining may add to the datapack, defaults to %i." % INLINE_BUDGET,
+)
+buildlike_parser.add_argument(
+    "--no-peephole",
+    default=[],
+    action="append",
+    choices=list(RULES) + ["all"],
+    metavar="RULE",
+    help="don't apply this peephole rule to the generated commands, one of %s or all. Can be given more than once."
+    % ", ".join(RULES),
+)
+buildlike_parser.add_argument(
+    "--no-fold",
+    action="store_true",
+    help="don't work out integer statements at compile time, compile each one to its own command.",
+)
+buildlike_parser.add_argument(
+    "--no-narrow-tags",
+    action="store_true",
+    help="don't narrow the cleanup and selectors of entity variables to the types of entities they hold.",
+)
+buildlike_parser.add_argument(
+    "--scores",
+    choices=SCORES,
+    default="entity",
+    help="what holds the scores of integer variables: the <pack>.VARS entity, or the fake player #<pack>. "
+    "Defaults to entity.",
+)
+buildlike_parser.add_argument(
+    "--no-share-objectives",
+    action="store_true",
+    help="give every integer variable its own objective, even if it is never alive at the same time as another one.",
+)
+buildlike_parser.add_argument(
+    "--flags",
+    choices=FLAGS,
+    default="entity",
+    help="how break, continue and else are tracked: with tagged area_effect_clouds, or with scores. "
+    "Defaults to entity.",
+)
+buildlike_parser.add_argument(
+    "--repeat-threshold",
+    type=int,
+    default=REPEAT_THRESHOLD,
+    metavar="N",
+    help="unroll repeat blocks of up to N repetitions, larger ones call their body through a chain of functions "
+    "which needs about log2 of the repetitions in commands. Defaults to %i." % REPEAT_THRESHOLD,
+)
+buildlike_parser.add_argument(
+    "--profile",
+    action="store_true",
+    help="print the time and peak memory of each phase of the build, and the definitions which took longest.",
+)
+buildlike_parser.add_argument(
+    "--profile-json",
+    default=None,
+    metavar="FILE",
+    help="write the profile of the build to FILE as JSON.",
+)
+buildlike_parser.add_argument(
+    "--profile-top",
+    type=positive_int,
+    default=PROFILE_TOP,
+    metavar="N",
+    help="the number of definitions listed in the profile, defaults to %i." % PROFILE_TOP,
+)
+buildlike_parser.add_argument(
+    "-j",
+    "--jobs",
+    type=positive_int,
+    default=None,
+    help="the number of threads used to write files, 1 writes them one at a time.",
+)
 buildlike_parser.add_argument("files", nargs="+")
 
 build_parser = subparser.add_parser(
@@ -53,6 +199,38 @@ link_parser.add_argument(
 watch_parser = subparser.add_parser(
     "watch", help="watch a set of files for changes", parents=[buildlike_parser]
 )
+watch_parser.add_argument(
+    "--debounce",
+    type=non_negative_float,
+    default=0.1,
+    help="seconds to wait for a burst of saves to finish before rebuilding, defaults to 0.1",
+)
+
+
+simulate_parser = subparser.add_parser(
+    "simulate",
+    help="compile files and run the load and tick functions without Minecraft, counting the commands they run",
+    parents=[buildlike_parser],
+)
+simulate_parser.add_argument(
+    "--ticks", type=int, default=1, help="the number of times to run the tick function, defaults to 1."
+)
+simulate_parser.add_argument(
+    "--players", type=int, default=1, help="the number of players online, defaults to 1."
+)
+simulate_parser.add_argument(
+    "--block",
+    default="air",
+    help="the block everywhere in the simulated world, defaults to air.",
+)
+simulate_parser.add_argument(
+    "--seed", type=int, default=0, help="the seed for @r and sort=random, defaults to 0."
+)
+simulate_parser.add_argument(
+    "--strict",
+    action="store_true",
+    help="stop at the first command which can't be simulated, instead of skipping it.",
+)
 
 
 def run(args=sys.argv):
@@ -62,14 +240,34 @@ def run(args=sys.argv):
     if args.cmd == "build":
         _run_build(args)
     elif args.cmd == "watch":
-        files = args.files = [os.path.realpath(file) for file in args.files]
-        prev = None
-        while True:
-            current = {file: os.stat(file).st_mtime for file in args.files}
-            if prev != current:
-                _run_build(args)
-                prev = current
-            time.sleep(1)
+        files = [os.path.realpath(file) for file in args.files]
+        cache = BuildCache()
+        watcher = create_watcher(args.debounce)
+        watched = list(files)
+        try:
+            while True:
+                # stamp the files before building, so that saves made during the build trigger another one
+                stamps = stamp_all(watched)
+                args.files = list(files)
+                _run_build(args, cache)
+
+                watched = list(files)
+                if cache.graph is not None:
+                    watched += [p for p in cache.graph.watched() if p not in files]
+                watcher.watch(watched, stamps)
+
+                changed = watcher.wait()
+                print('changed: ' + ', '.join(os.path.relpath(p) for p in changed))
+        except KeyboardInterrupt:
+            pass
+        finally:
+            watcher.close()
+    elif args.cmd == "simulate":
+        args.nofiles = True
+        simulation = Simulation(
+            ticks=args.ticks, players=args.players, seed=args.seed, block=args.block, strict=args.strict
+        )
+        _run_build(args, simulation=simulation)
     elif args.cmd == "link":
         mcdir = os.getenv("MINECRAFT_DIR")
         if mcdir is not None:
@@ -99,15 +297,60 @@ def run(args=sys.argv):
         sys.exit(1)
 
 
-def _run_build(args):
+def _run_build(args, cache=None, simulation=None):
     success = False
+    profiler = Profiler(args.profile_top) if args.profile or args.profile_json else None
     try:
         outdir = args.output[0] if args.output else args.files[0]
         outdir = os.path.realpath(os.path.splitext(outdir)[0])
-        success = compile(outdir, args.files, args.verbose, args.nofiles, args.zip, args.hide)
+        success = compile(
+            outdir,
+            args.files,
+            verbose=args.verbose,
+            nofiles=args.nofiles,
+            zip=args.zip,
+            hide=args.hide,
+            cache=cache,
+            jobs=args.jobs,
+            ziponly=args.zip_only,
+            compression=args.compression_level,
+            lazy=args.lazy,
+            exports=args.export,
+            callgraph=args.call_graph,
+            inline=args.inline_threshold,
+            inlinebudget=args.inline_budget,
+            peephole=[r for r in RULES if r not in args.no_peephole and "all" not in args.no_peephole],
+            fold=not args.no_fold,
+            scores=args.scores,
+            share=not args.no_share_objectives,
+            flags=args.flags,
+            repeat=args.repeat_threshold,
+            profiler=profiler,
+            costreport=args.cost_report,
+            simulation=simulation,
+            narrowtags=not args.no_narrow_tags,
+        )
     except CompilationError as e:
         print(e)
-        sys.exit()
+        if cache is None:
+            sys.exit()
+    except InterpreterError as e:
+        print(e)
+        sys.exit(1)
+    except OSError as e:
+        # a watched file may be deleted or half-written, the next change will trigger another build
+        if cache is None:
+            raise
+        print(e)
+
+    if profiler is not None and profiler.phases:
+        if args.profile:
+            print(profiler.to_text())
+        if args.profile_json:
+            profiler.write(args.profile_json)
+
+    if simulation is not None and simulation.interpreter is not None:
+        print(simulation.to_text())
 
     if success:
         print(f"successfully created datapack {os.path.basename(outdir)!r}")
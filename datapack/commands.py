@@ -1,3 +1,5 @@
+import re
+
 # entity tools
 
 
@@ -25,34 +27,104 @@ def remove_entity(query, tag):
     return 'tag %s remove %s' % (query, tag)
 
 
-def clear_tag(tag):
+# removes <tag> from everything which has it. <kind> is 'player' if only players can have it, or the type of entity
+# which can, if known.
+def clear_tag(tag, kind=None):
+    if kind == 'player':
+        return 'tag @a[tag=%s] remove %s' % (tag, tag)
+    elif kind is not None:
+        return 'tag @e[type=%s,tag=%s] remove %s' % (kind, tag, tag)
     return 'tag @e[tag=%s] remove %s' % (tag, tag)
 
 
+# returns the tag removed by <command> if it was made by clear_tag, otherwise None
+def cleared_tag(command):
+    if not command.startswith('tag @'):
+        return None
+    match = CLEAR.match(command)
+    if match is None:
+        return None
+    return match.group(1)
+
+
+CLEAR = re.compile(r'tag @[ae]\[(?:type=[^,\]]+,)?tag=([\w.+-]+)\] remove \1$')
+
+# the clarifiers of variables which only hold players
+PLAYERS = ('p', '1p', 'p1')
+
+
 # integer tools
 
+# scoreboard scores are 32 bit signed integers
+INT_MIN = -2 ** 31
+INT_MAX = 2 ** 31 - 1
+
+
+# returns <value> as it would end up in a score, after overflowing
+def wrap(value):
+    return (value - INT_MIN) % 2 ** 32 + INT_MIN
+
+
+# returns the result of the scoreboard operation <op> on the scores <a> and <b>, or None if it can't be worked out
+# at compile time. Division is floored like in game, division by zero is left for the game to report.
+def fold_operation(a, op, b):
+
+    if a is None or b is None:
+        return None
+    if op == '+=':
+        return wrap(a + b)
+    if op == '-=':
+        return wrap(a - b)
+    if op == '*=':
+        return wrap(a * b)
+    if op == '/=' and b != 0:
+        return wrap(a // b)
+    if op == '%=' and b > 0:
+        return a % b
+    if op == '<':
+        return min(a, b)
+    if op == '>':
+        return max(a, b)
+    return None
+
+
+# the ways integer variables can be stored. Every variable has its own objective, and all of them are held by either
+# the <pack>.VARS entity, which is summoned by load, or by the fake player #<pack>.
+SCORES = ('entity', 'fakeplayer')
+
+
+# returns what holds the scores of integer variables
+def score_holder(namespace):
+    if namespace.scores == 'fakeplayer':
+        return '#' + namespace.pack
+    return '@e[name=%s.VARS,limit=1]' % namespace.pack
+
+
 def assign_int(value, var, namespace):
-    return 'scoreboard players set @e[name=%s.VARS,limit=1] %s %s' % (namespace.pack, namespace.intmap[var], value)
+    return 'scoreboard players set %s %s %s' % (score_holder(namespace), namespace.intmap[var], value)
 
 
 def add_int(value, var, namespace):
-    return 'scoreboard players add @e[name=%s.VARS,limit=1] %s %s' % (namespace.pack, namespace.intmap[var], value)
+    return 'scoreboard players add %s %s %s' % (score_holder(namespace), namespace.intmap[var], value)
 
 
 def sub_int(value, var, namespace):
-    return 'scoreboard players remove @e[name=%s.VARS,limit=1] %s %s' % (namespace.pack, namespace.intmap[var], value)
+    return 'scoreboard players remove %s %s %s' % (score_holder(namespace), namespace.intmap[var], value)
 
 
 def augment_int(var1, var2, op, namespace):
-    return 'scoreboard players operation @e[name=%s.VARS,limit=1] %s %s @e[name=%s.VARS,limit=1] %s' % (
-    namespace.pack, namespace.intmap[var1], op, namespace.pack, namespace.intmap[var2])
+    holder = score_holder(namespace)
+    return 'scoreboard players operation %s %s %s %s %s' % (
+    holder, namespace.intmap[var1], op, holder, namespace.intmap[var2])
 
 
 def select_int(var, namespace):
-    return '@e[name=%s.VARS,limit=1] %s' % (namespace.pack, namespace.intmap[var])
+    return '%s %s' % (score_holder(namespace), namespace.intmap[var])
 
 
 def text_int(var, namespace):
+    if namespace.scores == 'fakeplayer':
+        return '{"score":{"name":"#%s","objective":"%s"}}' % (namespace.pack, namespace.intmap[var])
     return '{"score":{"name":"@e[name=%s.VARS]","objective":"%s"}}' % (namespace.pack, namespace.intmap[var])
 
 
@@ -63,6 +135,8 @@ def summon_vars(pack):
 
 
 def check_int(var, op, val, namespace):
+    if namespace.scores == 'fakeplayer':
+        return check_score(var, op, val, namespace)
     if op == '==':
         return 'entity @e[name=%s.VARS,scores={%s=%s}]' % (namespace.pack, namespace.intmap[var], val)
     if op == '>=':
@@ -75,5 +149,46 @@ def check_int(var, op, val, namespace):
         return 'entity @e[name=%s.VARS,scores={%s=..%s}]' % (namespace.pack, namespace.intmap[var], str(int(val) - 1))
 
 
+# like check_int, as an "if score" condition on the fake player
+def check_score(var, op, val, namespace):
+    score = 'score #%s %s matches ' % (namespace.pack, namespace.intmap[var])
+    if op == '==':
+        return score + val
+    if op == '>=':
+        return score + val + '..'
+    if op == '<=':
+        return score + '..' + val
+    if op == '>':
+        return score + str(int(val) + 1) + '..'
+    if op == '<':
+        return score + '..' + str(int(val) - 1)
+
+
+# control flow flags, for break, continue and else
+
+# the ways control flow flags can be stored: as a tagged area_effect_cloud which exists while the flag is set, or as
+# an integer variable which is 1 while the flag is set.
+FLAGS = ('entity', 'scoreboard')
+
+
+def set_flag(flag, namespace):
+    if namespace.flags == 'scoreboard':
+        return assign_int('1', flag, namespace)
+    return 'summon area_effect_cloud 0 0 0 {Age:-2147483648,Duration:-1,WaitTime:-2147483648,Tags:["%s"]}' % flag
+
+
+def clear_flag(flag, namespace):
+    if namespace.flags == 'scoreboard':
+        return assign_int('0', flag, namespace)
+    return 'kill @e[tag=%s]' % flag
+
+
+# returns the condition, for use after "if" or "unless", which holds while <flag> is set
+def check_flag(flag, namespace):
+    if namespace.flags == 'scoreboard':
+        return 'score %s %s matches 1' % (score_holder(namespace), namespace.intmap[flag])
+    return 'entity @e[tag=%s]' % flag
+
+
 def op_converse(op):
     return op.replace('>', '@').replace('<', '>').replace('@', '<')
\ No newline at end of file
@@ -1,7 +1,10 @@
 import os
-import shutil
 
 from .namespace import *
+from .cost import CostReport
+from .interpreter import Simulation, InterpreterError
+from .incremental import BuildCache
+from .writer import *
 from .function import CompilationError
 
 MCMETA = '''{
@@ -19,76 +22,93 @@ LOADTICK = '''{
 }'''
 
 
-def compile(destination, files, verbose=False, nofiles=False, zip=False, hide=False):
+def compile(destination, files, verbose=False, nofiles=False, zip=False, hide=False, cache=None, jobs=None,
+            ziponly=False, compression=None, lazy=False, exports=(), callgraph=None, inline=INLINE_THRESHOLD,
+            inlinebudget=INLINE_BUDGET, peephole=tuple(RULES), fold=True, scores='entity', share=True,
+            flags='entity', repeat=REPEAT_THRESHOLD, profiler=None, costreport=None, simulation=None,
+            narrowtags=True):
     """files is a list of text files containing your code.
-    destination points to the folder where you want your datapack to end up"""
+    destination points to the folder where you want your datapack to end up
+    cache is an optional BuildCache, which lets repeated builds of the same files reuse unchanged functions
+    jobs is the number of threads used to write files, 1 writes them serially
+    ziponly only creates the zip archive, without the datapack folder
+    compression is the compression level of the zip archive, from 0 (none) to 9
+    lazy only compiles functions reachable from load, tick and the function names in exports
+    callgraph is a file to write the call graph of the datapack to, as DOT if it ends with .dot, otherwise JSON
+    inline is the most commands a function may have for calls to it to be inlined, 1 only inlines single
+    commands. inlinebudget is the most commands inlining may add to the datapack.
+    peephole is the names of the peephole rules to apply to the generated commands, all of them by default
+    fold works out integer statements whose value is known at compile time, writing only the final values
+    scores is what holds the scores of integer variables: 'entity' for the <pack>.VARS entity, or 'fakeplayer'
+    share lets integer variables which are never alive at the same time share an objective
+    flags is how break, continue and else are tracked: 'entity' for tagged area_effect_clouds, or 'scoreboard'
+    repeat is the most repetitions a repeat block is unrolled for, larger ones call their body through a chain of
+    functions which each double the number of calls
+    profiler is an optional Profiler, which measures the time and memory spent on each phase of the build
+    costreport is a file to write what each generated function costs to run to, as JSON if it ends with .json,
+    otherwise as a table
+    simulation is an optional Simulation, which runs the compiled load and tick functions without Minecraft
+    narrowtags narrows the cleanup and selectors of entity variables to the types of entities they hold"""
 
     packname = destination.split('/')[-1].split('\\')[-1]
 
-    namespace = Namespace(packname, files)
-    namespace.compile(verbose, hide)
+    namespace = Namespace(packname, files, cache)
+    namespace.compile(verbose, hide, lazy=lazy, exports=exports, inline=inline, budget=inlinebudget,
+                      peephole=peephole, fold=fold, scores=scores, share=share, flags=flags, repeat=repeat,
+                      profiler=profiler, narrowtags=narrowtags)
+    namespace.phase('write')
 
-    if nofiles:
-        return False
+    if callgraph is not None:
+        namespace.callgraph.write(callgraph)
+
+    if costreport is not None:
+        CostReport(namespace).write(costreport)
 
-    # generate the file layout
-    os.chdir("..")
+    if simulation is not None:
+        simulation.run(namespace, hide)
 
-    def create_folder(*path):
-        try:
-            os.makedirs(os.path.join(*path))
-        except FileExistsError:
-            pass
+    if nofiles:
+        namespace.phase(None)
+        return False
 
-    create_folder(destination, 'data', 'minecraft', 'tags', 'functions')
-    with open(os.path.join(destination, 'pack.mcmeta'), 'w') as f:
-        f.write(MCMETA)
+    writer = Writer(destination, ['data/' + packname + '/functions'])
+    writer.write('pack.mcmeta', MCMETA)
 
     # load
-    with open(os.path.join(destination, 'data', 'minecraft', 'tags', 'functions', 'load.json'), 'w') as f:
-        for func in namespace.functions:
-            if func == 'main.load':
-                f.write(LOADTICK % ('"' + packname + ':load"'))
-                break
-        else:
-            f.write(LOADTICK % "")
+    if 'main.load' in namespace.functions:
+        writer.write('data/minecraft/tags/functions/load.json', LOADTICK % ('"' + packname + ':load"'))
+    else:
+        writer.write('data/minecraft/tags/functions/load.json', LOADTICK % "")
 
     # tick
-    with open(os.path.join(destination, 'data', 'minecraft', 'tags', 'functions', 'tick.json'), 'w') as f:
-        for func in namespace.functions:
-            if func == 'main.tick':
-                f.write(LOADTICK % ('"' + packname + ':tick"'))
-                break
-        else:
-            f.write(LOADTICK % "")
+    if 'main.tick' in namespace.functions:
+        writer.write('data/minecraft/tags/functions/tick.json', LOADTICK % ('"' + packname + ':tick"'))
+    else:
+        writer.write('data/minecraft/tags/functions/tick.json', LOADTICK % "")
 
     # actual datapack
-    try:
-        shutil.rmtree(os.path.join(destination, 'data', packname, 'functions'))
-    except:
-        pass
-
-    create_folder(destination, 'data', packname, 'functions')
-        
     for funcname in namespace.functions:
         func = namespace.functions[funcname]
-        if hide and func.path != func.infunc:
-            create_folder(destination, 'data', packname, 'functions', '.'.join(func.infunc)[5:])
-            name = os.path.join('.'.join(func.infunc)[5:], funcname[5:] + '.mcfunction')
-        else:
-            name = funcname[5:] + '.mcfunction'
-
-        with open(os.path.join(destination, 'data', packname, 'functions', name), 'w') as f:
-            f.write('\n'.join(func.commands))
+        name = namespace.output_name(func, hide) + '.mcfunction'
+        writer.write('data/' + packname + '/functions/' + name, '\n'.join(func.commands))
 
     # file copies
     for source in namespace.copyfiles:
         dest = os.path.abspath(os.path.join(destination, namespace.copyfiles[source]))
-        create_folder(dest)
-        shutil.copy(source, dest)
-        print('copying file "' + source + '" to "' + dest + '"...')
+        writer.copy(source, writer.relative(os.path.join(dest, os.path.basename(source))))
+
+    if not ziponly:
+        for path in writer.finish(jobs):
+            print('copying file "' + writer.copies[path] + '" to "' + os.path.dirname(writer.absolute(path)) + '"...')
+
+        if verbose:
+            print('\nwrote %i files, %i unchanged, %i removed in %.3f seconds' % (
+                writer.written, writer.unchanged, writer.deleted, writer.elapsed))
 
-    if zip:
-        shutil.make_archive(destination, 'zip', destination)
+    if zip or ziponly:
+        writer.archive(destination + '.zip', compression)
+        if verbose:
+            print('\nzipped %i files in %.3f seconds' % (writer.zipped, writer.zipelapsed))
 
+    namespace.phase(None)
     return True
@@ -0,0 +1,134 @@
+import json
+import re
+
+from .callgraph import *
+
+# what is counted for every function, see command_cost
+METRICS = ('commands', 'selectors', 'summon', 'kill', 'tag')
+
+# an execute subcommand which may run the rest of the command for more than one entity
+FANOUT = re.compile(r'\b(?:as|at) @[ae](?:\[([^\]]*)\])?')
+
+
+# returns how much <command> costs on its own, as a list with an entry for each of METRICS
+def command_cost(command):
+
+    # calls to empty functions are commented out, and cost nothing
+    if command.startswith('#'):
+        return [0] * len(METRICS)
+    word = command.rsplit(' run ', 1)[-1].split(' ', 1)[0]
+    return [1, command.count('@e'), int(word == 'summon'), int(word == 'kill'), int(word == 'tag')]
+
+
+# whether <command> runs whatever it calls once for every one of several entities
+def fans_out(command):
+
+    if not command.startswith('execute '):
+        return False
+    for match in FANOUT.finditer(command):
+        if match.group(1) is None or 'limit=1' not in match.group(1):
+            return True
+    return False
+
+
+# estimates what the functions of a compiled namespace cost to run. Each function has its own cost, and a total which
+# adds the total of every function it calls, once per call. Loops are recursive functions, so they have no bounded
+# total: calls back into the loop are left out, and the function and everything calling it is flagged as a loop.
+# Calls run for every entity an execute picks are counted once and flagged as well. Scheduled functions don't run
+# right away, and are left out.
+class CostReport:
+
+    def __init__(self, namespace):
+
+        self.pack = namespace.pack
+        graph = CallGraph(namespace, [])
+
+        # each of these follows this format: {Function.name : [value for each of METRICS]}
+        self.own = {}
+        self.total = {}
+
+        # functions whose total is a lower bound, follows this format: {Function.name : set of flags}
+        self.flags = {}
+
+        # the calls of each function, once per call: {Function.name : [(called Function.name, fans out), ...]}
+        sites = {}
+        for name, func in namespace.functions.items():
+            own = [0] * len(METRICS)
+            sites[name] = []
+            for command in func.commands:
+                own = [a + b for a, b in zip(own, command_cost(command))]
+                if command.startswith('#') or 'function ' not in command or \
+                        command.rsplit(' run ', 1)[-1].startswith('schedule '):
+                    continue
+                fanout = fans_out(command)
+                sites[name].extend((callee, fanout) for callee in graph.callees(command)
+                                   if callee in namespace.functions)
+            self.own[name] = own
+            self.flags[name] = set()
+
+        # callees first, so that their totals are known
+        for component in graph.components():
+            recursive = len(component) > 1 or component[0] in graph.calls[component[0]]
+            for name in component:
+                total = list(self.own[name])
+                if recursive:
+                    self.flags[name].add('loop')
+                for callee, fanout in sites[name]:
+                    if fanout:
+                        self.flags[name].add('per entity')
+                    if callee in component:
+                        continue
+                    total = [a + b for a, b in zip(total, self.total[callee])]
+                    self.flags[name] |= self.flags[callee]
+                self.total[name] = total
+
+    # returns (commands, flags) for the worst case of main.tick, or None if there is no tick function
+    def tick(self):
+
+        if 'main.tick' not in self.total:
+            return None
+        return self.total['main.tick'][0], self.flags['main.tick']
+
+    def to_json(self):
+
+        tick = self.tick()
+        report = {
+            'pack': self.pack,
+            'tick': None if tick is None else {'commands': tick[0], 'flags': sorted(tick[1])},
+            'functions': {name[5:]: {
+                'own': dict(zip(METRICS, self.own[name])),
+                'total': dict(zip(METRICS, self.total[name])),
+                'flags': sorted(self.flags[name]),
+            } for name in self.own},
+        }
+        return json.dumps(report, indent=4) + '\n'
+
+    # a table of every function, those with the highest total first. Apart from its own commands, the columns are
+    # totals.
+    def to_text(self):
+
+        out = []
+        tick = self.tick()
+        if tick is None:
+            out.append('no tick function')
+        else:
+            out.append('worst case per tick: %i commands' % tick[0])
+            if tick[1]:
+                out.append('it may run more, because of: ' + ', '.join(sorted(tick[1])))
+
+        out.append('')
+        out.append('%-32s %8s %8s %8s %8s %8s %8s  %s' % (
+            'function', 'own', 'total', '@e', 'summon', 'kill', 'tag', 'flags'))
+        for name in sorted(self.own, key=lambda name: (-self.total[name][0], name)):
+            row = (name[5:], self.own[name][0]) + tuple(self.total[name]) + (', '.join(sorted(self.flags[name])),)
+            out.append(('%-32s %8i %8i %8i %8i %8i %8i  %s' % row).rstrip())
+        return '\n'.join(out) + '\n'
+
+    # writes the report to <path>, as JSON if it ends with .json, otherwise as a table
+    def write(self, path):
+
+        with open(path, 'w') as f:
+            if path.endswith('.json'):
+                f.write(self.to_json())
+            else:
+                f.write(self.to_text())
@@ -0,0 +1,252 @@
+import re
+
+from .commands import *
+
+# anything which could be a tag
+NAME = re.compile(r'[\w.+-]+')
+
+# the subcommand of a command which adds a tag, or summons an entity
+ADD = re.compile(r'(?:^|.* run )tag (\S+) add ([\w.+-]+)$')
+SUMMON = re.compile(r'(?:^|.* run )summon (\S+)')
+
+
+# splits <text> at its spaces, except for those inside brackets or braces
+def words(text):
+
+    out = []
+    depth = 0
+    start = 0
+    for i, c in enumerate(text):
+        if c in '[{':
+            depth += 1
+        elif c in ']}':
+            depth -= 1
+        elif c == ' ' and depth == 0:
+            if i > start:
+                out.append(text[start:i])
+            start = i + 1
+    if len(text) > start:
+        out.append(text[start:])
+    return out
+
+
+# returns the selector of the last 'as' subcommand of the execute command <prefix>, which is what @s is after it, or
+# None if that isn't known. 'rotated as', 'positioned as', 'facing entity', 'on' and 'summon' leave it unknown.
+def executor(prefix):
+
+    if not prefix.startswith('execute '):
+        return None
+    tokens = words(prefix)
+    selector = None
+    for i in range(1, len(tokens)):
+        token = tokens[i]
+        if token == 'as' and i + 1 < len(tokens):
+            if tokens[i - 1] in ('rotated', 'positioned'):
+                selector = None
+            elif tokens[i + 1] != '@s':
+                selector = tokens[i + 1]
+        elif (token == 'entity' and tokens[i - 1] == 'facing') or token in ('on', 'summon'):
+            selector = None
+    return selector
+
+
+# splits the arguments of the selector <selector> into (key, value) pairs. Returns None if it has any brackets,
+# quotes or braces in its arguments, which are left alone.
+def selector_arguments(selector):
+
+    if not selector.endswith(']') or selector.find('[') != 2:
+        return None
+    inner = selector[3:-1]
+    if any(c in inner for c in '[]{}"\''):
+        return None
+    arguments = []
+    for argument in inner.split(','):
+        key, sep, value = argument.partition('=')
+        arguments.append((key.strip(), value.strip()))
+    return arguments
+
+
+# finds out what can have the tag of each entity variable, from every command which adds one. A tag which is only
+# added to one type of entity is only looked for among that type: it is cleared with a type= filter, or through @a
+# for players, and selectors which read it get the same filter. A tag which nothing ever adds doesn't need to be
+# cleared at all. Tags which show up anywhere else, e.g. in NBT, are left alone.
+class EntityTags:
+
+    def __init__(self, namespace):
+
+        self.namespace = namespace
+
+        # the tags cleared by clear_tag, the only ones considered
+        self.tags = set()
+        for func in namespace.functions.values():
+            for command in func.commands:
+                tag = cleared_tag(command)
+                if tag is not None:
+                    self.tags.add(tag)
+
+        # what each tag is added to, follows this format: {tag : [(kind, value), ...]}, where kind is 'type' for a
+        # type of entity, 'tag' for whatever has another tag, or None if anything could get it
+        self.sources = {tag: [] for tag in self.tags}
+
+        for func in namespace.functions.values():
+            for command in func.commands:
+                # the tag of every variable starts with main.
+                if command.startswith('#') or 'main.' not in command:
+                    continue
+                for match in NAME.finditer(command):
+                    if match.group(0) in self.tags:
+                        self.scan(command, match)
+
+        # an entry follows this format: {tag : set of types}, for tags which are only ever added to entities of
+        # known types
+        self.types = self.resolve()
+
+        # the number of cleanups removed, and of cleanups and selectors given a filter
+        self.removed = 0
+        self.narrowed = 0
+
+    # records how the tag matched by <match> is used in <command>
+    def scan(self, command, match):
+
+        tag = match.group(0)
+        start, end = match.span()
+
+        # reading a tag, or removing it
+        if command[start - 4:start] == 'tag=' or command[start - 5:start] == 'tag=!':
+            return
+        if end == len(command) and command[:start].endswith(' remove '):
+            return
+
+        add = ADD.match(command)
+        if add is not None and add.end(2) == end:
+            self.sources[tag].append(self.selector_kind(add.group(1), command[:add.start(1)]))
+            return
+
+        summon = SUMMON.match(command)
+        if summon is not None and command[start - 1:end + 1] == '"' + tag + '"' and \
+                'Tags:[' in command[summon.end():start]:
+            self.sources[tag].append(('type', self.entity_type(summon.group(1))))
+            return
+
+        self.sources[tag].append((None, None))
+
+    # returns what <selector> can pick, as (kind, value) like in self.sources. <prefix> is the part of the command
+    # before it, which tells what @s is.
+    def selector_kind(self, selector, prefix):
+
+        if selector[:2] in ('@a', '@p', '@r'):
+            return ('type', 'player')
+
+        if selector == '@s':
+            selector = executor(prefix)
+            if selector is None:
+                return (None, None)
+            return self.selector_kind(selector, '')
+
+        if not selector.startswith('@e'):
+            return (None, None)
+        arguments = selector_arguments(selector) if selector != '@e' else []
+        if arguments is None:
+            return (None, None)
+
+        types = [value for key, value in arguments if key == 'type']
+        if len(types) == 1 and not types[0].startswith('!') and not types[0].startswith('#'):
+            return ('type', self.entity_type(types[0]))
+        for key, value in arguments:
+            if key == 'tag' and value in self.tags:
+                return ('tag', value)
+        return (None, None)
+
+    # returns the entity type <name>, without the minecraft: prefix
+    def entity_type(self, name):
+
+        if name.startswith('minecraft:'):
+            return name[10:]
+        return name
+
+    # returns the types each tag is added to, following tags added to whatever has another tag until nothing changes
+    def resolve(self):
+
+        types = {tag: set() for tag in self.tags}
+        unknown = set(tag for tag in self.tags if any(kind is None for kind, value in self.sources[tag]))
+
+        changed = True
+        while changed:
+            changed = False
+            for tag in self.tags:
+                if tag in unknown:
+                    continue
+                for kind, value in self.sources[tag]:
+                    if kind == 'type' and value not in types[tag]:
+                        types[tag].add(value)
+                        changed = True
+                    elif kind == 'tag':
+                        if value in unknown:
+                            unknown.add(tag)
+                            changed = True
+                            break
+                        if not types[value] <= types[tag]:
+                            types[tag] |= types[value]
+                            changed = True
+
+        return {tag: types[tag] for tag in self.tags if tag not in unknown}
+
+    # returns the single type the tag <tag> is added to, or None
+    def kind(self, tag):
+
+        types = self.types.get(tag)
+        if types is None or len(types) != 1:
+            return None
+        return next(iter(types))
+
+    # rewrites the commands of every function. A function is never left empty, calls to it have already been linked.
+    def optimize(self):
+
+        if not self.tags:
+            return
+
+        for func in self.namespace.functions.values():
+            commands = []
+            for command in func.commands:
+                tag = cleared_tag(command)
+                if tag is not None and tag in self.types and not self.types[tag]:
+                    self.removed += 1
+                    continue
+                if tag is not None:
+                    new = clear_tag(tag, self.kind(tag) or ('player' if command.startswith('tag @a') else None))
+                else:
+                    new = self.filter(command)
+                if new != command:
+                    self.narrowed += 1
+                commands.append(new)
+
+            if not commands and func.commands:
+                commands = func.commands[-1:]
+                self.removed -= 1
+            func.commands = commands
+
+    # returns <command> with a type= filter added to every selector which only picks entities by their tag
+    def filter(self, command):
+
+        if '@e[tag=' not in command:
+            return command
+
+        out = []
+        index = 0
+        while True:
+            start = command.find('@e[tag=', index)
+            if start == -1:
+                break
+            end = command.find(']', start)
+            if end == -1:
+                break
+            arguments = selector_arguments(command[start:end + 1])
+            kind = self.kind(arguments[0][1]) if arguments else None
+            if kind is not None and not any(key == 'type' for key, value in arguments):
+                out.append(command[index:start + 3] + 'type=' + kind + ',')
+                index = start + 3
+            else:
+                out.append(command[index:start + 3])
+                index = start + 3
+        out.append(command[index:])
+        return ''.join(out)
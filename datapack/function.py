@@ -1,7 +1,11 @@
 from .commands import *
 from .reader import *
+from .scope import *
 from .validate import *
 
+# repeat blocks with more repetitions than this call their body through a chain of doubling functions
+REPEAT_THRESHOLD = 64
+
 
 class CompilationError(Exception):
     pass
@@ -24,9 +28,13 @@ class Function:
         self.path = path
         self.name = '.'.join(path)
 
+        # every scope this function can see references in, innermost first
+        self.chain = scope_chain(path)
+
         self.namespace = namespace
         self.functions = namespace.functions
 
+        # a SymbolTable, shared with the creating function until either of them declares something
         self.refs = refs.copy()
         self.pack = namespace.pack
 
@@ -57,11 +65,8 @@ class Function:
         # values for string parameters
         self.stringdata = stringdata
 
-        # stores the content of the line before the one we are currently parsing. Currently only used for if-else logic.
-        self.pastline = ''
-
-        # this will get set to true when this function is called by another function. Unused functions will get "collapsed".
-        self.used = False
+        # stores the tokens of the line before the one we are currently parsing. Currently only used for if-else logic.
+        self.pastline = []
 
         # stuff with break/return
         self.infunc = infunc  # stores the user-defined function which this function is a member of
@@ -69,6 +74,13 @@ class Function:
         self.hasbreak = False
         self.hascontinue = False
 
+        # integer variables whose value is known at compile time, follows this format: {reference path : value}.
+        # only straight-line integer statements in this function are folded, any other line forgets them.
+        self.known = {}
+
+        # the known variables which haven't been written to their score yet, in the order they were assigned
+        self.pending = {}
+
         # update the namespace intmap, this must be done in __init__ because other functions may call this function
         # before it has been compiled.
         for p in self.params:
@@ -88,20 +100,12 @@ class Function:
     # and then check upwards to parent functions.
     def reference_path(self, var):
 
-        for i in range(len(self.path), 0, -1):
-            test_path = '.'.join(self.path[:i]) + '.' + var
-            if test_path in self.refs:
-                return test_path
-        return None
+        return self.refs.resolve(var, self.chain)
 
     # Return the path to a function with name <var>. Works the same way as reference_path.
     def function_path(self, var):
 
-        for i in range(len(self.path), 0, -1):
-            test_path = '.'.join(self.path[:i]) + '.' + var
-            if test_path in self.functions:
-                return test_path
-        return None
+        return self.namespace.functionindex.resolve(var, self.chain)
 
     def parse_clarifiers(self, clarifiers, path):
 
@@ -130,6 +134,13 @@ class Function:
         else:
             return select_entity(path)
 
+    # returns the tokens of the line at <pointer>, shared through the namespace's line cache.
+    # the returned list must not be modified.
+    def line_tokens(self, pointer):
+
+        line = self.lines[pointer]
+        return self.namespace.linecache.tokens(line[1], line[2])
+
     # will create an exception with line number and function name
     # syntaxerror means we are dealing with missing content
     def raise_exception(self, string, syntaxerror=False):
@@ -191,20 +202,20 @@ class Function:
                     self.raise_exception('A function with defaults cannot have any sub-functions.')
 
                 self.pointer = i
-                tokens = tokenize(p[1])
+                tokens = self.namespace.linecache.tokens(p[1], p[2])
                 if len(tokens) < 2:
                     self.raise_exception('No function name provided.')
 
-                if not valid_function(tokens[1].strip()):
-                    self.raise_exception('Invalid function name: "' + tokens[1].strip() + '".')
+                if not valid_function(tokens[1].text):
+                    self.raise_exception('Invalid function name: "' + tokens[1].text + '".')
 
-                funcpath = self.path + [tokens[1].strip()]
+                funcpath = self.path + [tokens[1].text]
                 funcparams = {}
                 funcdefaults = {}
                 hasdefault = False
 
-                for token in (''.join(tokens[2:])).split(' '):
-                    token = token.strip(':')
+                for arg in split_arguments(tokens[2:]):
+                    token = join_tokens(arg).strip(':')
                     default = None
 
                     equals = token.split('=')
@@ -227,20 +238,19 @@ class Function:
                             funcparams[param[0]] = '1'
                         else:
                             self.raise_exception(
-                                'Invalid parameter clarifier "' + token.strip() + '" for function "' + tokens[
-                                    1].strip() + '".')
+                                'Invalid parameter clarifier "' + token + '" for function "' + tokens[1].text + '".')
 
                         if default:
                             funcdefaults[param[0]] = default
                     else:
                         self.raise_exception(
-                            'Invalid parameter name "' + token.strip() + '" for function "' + tokens[1].strip() + '".')
+                            'Invalid parameter name "' + token + '" for function "' + tokens[1].text + '".')
 
                 if '.'.join(funcpath) in self.functions:
                     self.raise_exception('Duplicate function "' + funcpath[-1] + '"')
 
-                self.functions['.'.join(funcpath)] = Function(funcpath, self.refs, funcparams, funcdefaults, self.lines, self.namespace,
-                                                              storepointer + i + 1, depth + 1, funcpath, None, self.stringdata)
+                self.namespace.add_function(Function(funcpath, self.refs, funcparams, funcdefaults, self.lines, self.namespace,
+                                                     storepointer + i + 1, depth + 1, funcpath, None, self.stringdata))
                 self.functions['.'.join(funcpath)].compiledefs()
 
         self.pointer = storepointer
@@ -267,54 +277,111 @@ class Function:
                 break
             self.pointer += 1
 
+        self.flush()
+
         # dispel local entities
-        for ref in self.locals:
-            if self.refs[ref] in ('e', 'p', '1', '1p', 'p1'):  # an entity
-                self.add_command(clear_tag(ref))
+        self.clear_tags((ref, self.refs[ref]) for ref in self.locals if self.refs[ref] in ('e', 'p', '1', '1p', 'p1'))
+
+    # removes the tags of entity variables from everything which has them, once each. <tags> are pairs of
+    # (tag, clarifier), variables declared to hold players are only looked for among players, unless tags aren't
+    # narrowed. See also EntityTags.
+    def clear_tags(self, tags):
+
+        for tag, clarifier in dict.fromkeys(tags):
+            player = self.namespace.narrowtags and clarifier in PLAYERS
+            self.add_command(clear_tag(tag, 'player' if player else None))
+
+    # whether the line with <tokens> only assigns an integer variable, possibly from another one. Such lines can be
+    # folded, any other line may read or change integer variables behind the compiler's back.
+    def integer_statement(self, tokens, line, destpath):
+
+        if len(tokens) == 2:
+            return tokens[1].text in ('++', '--') and destpath is not None and self.refs[destpath] == 'i'
+        if len(tokens) < 3:
+            return False
+
+        expression = line[tokens[2].start:].strip()
+        inref = self.reference_path(expression)
+        if not valid_int(expression) and (inref is None or self.refs[inref] != 'i'):
+            return False
+
+        if tokens[1].text == '=':
+            return (tokens[0].clarifiers or '') in ('', 'i')
+        return tokens[1].text in ('+=', '-=', '/=', '*=', '%=', '<', '>') and destpath is not None and \
+            self.refs[destpath] == 'i'
+
+    # records <value> as the value of the integer variable <ref> after the current line, if it is known at compile
+    # time. Returns whether it was, otherwise every pending value is written out and the line should emit its
+    # commands as usual.
+    def fold(self, ref, value):
+
+        if self.namespace.fold and value is not None and INT_MIN <= value <= INT_MAX:
+            self.known[ref] = value
+            self.pending[ref] = True
+            self.namespace.folded += 1
+            return True
+
+        self.flush()
+        self.known.pop(ref, None)
+        return False
+
+    # writes every pending value to its score
+    def flush(self):
+
+        for ref in self.pending:
+            self.add_command(assign_int(str(self.known[ref]), ref, self.namespace))
+        self.pending = {}
+
+    # writes every pending value to its score and forgets all known values
+    def forget(self):
+
+        self.flush()
+        self.known = {}
 
     # called on a single token. Detects references and handles clarifiers. For multi-token strings, use process_tokens.
     def process_expression(self, expression):
 
-        components = expression.strip().split('#')
-        ref = components[0]
+        ref, sep, clarifiers = expression.strip().partition('#')
+        out = self.process_reference(ref, clarifiers if sep else None)
+        if out is None:  # a simple constant
+            return expression
+        return out + (' ' if expression[-1] == ' ' else '')
+
+    # returns what the reference <ref> with the clarifiers <clarifiers> evaluates to,
+    # or None if <ref> is not a reference. <clarifiers> is None if no '#' was given.
+    def process_reference(self, ref, clarifiers):
 
-        if len(components) == 2 and components[1] == 'v':
+        if clarifiers == 'v':
             return ref
 
         path = self.reference_path(ref)
-        if path is not None:  # some reference
-            if self.refs[path] in ('e', 'p', '1', '1p', 'p1'):  # an entity
-                out = ''
+        if path is None:
+            return None
 
-                if len(components) > 1:
-                    clarifiers = components[1] + self.refs[path]
-                else:
-                    clarifiers = self.refs[path]
-
-                return self.parse_clarifiers(clarifiers, path) + (' ' if expression[-1] == ' ' else '')
-
-            elif self.refs[path] == 'i':  # integer variable
-                out = ''
-                if len(components) == 2:
-                    clarifiers = expression.strip().split('#')[1]
-                    if clarifiers == '':
-                        out = select_int(path, self.namespace)
-                    elif clarifiers == 't':
-                        out = text_int(path, self.namespace)
-                    else:
-                        self.raise_exception('Unknown clarifier: "%s"' % clarifiers)
-                else:
-                    out = select_int(path, self.namespace)
-                return out + (' ' if expression[-1] == ' ' else '')
+        if self.refs[path] in ('e', 'p', '1', '1p', 'p1'):  # an entity
 
-            elif self.refs[path] == 's':  # string parameter
-                if path in self.stringdata:
-                    return self.stringdata[path] + (' ' if expression[-1] == ' ' else '')
-                else:
-                    return '!s{' + path + '}' + (' ' if expression[-1] == ' ' else '')
+            if clarifiers is not None:
+                clarifiers = clarifiers + self.refs[path]
+            else:
+                clarifiers = self.refs[path]
+
+            return self.parse_clarifiers(clarifiers, path)
+
+        elif self.refs[path] == 'i':  # integer variable
+            if clarifiers is None or clarifiers == '':
+                return select_int(path, self.namespace)
+            elif clarifiers == 't':
+                return text_int(path, self.namespace)
+            else:
+                self.raise_exception('Unknown clarifier: "%s"' % clarifiers)
+
+        elif self.refs[path] == 's':  # string parameter
+            if path in self.stringdata:
+                return self.stringdata[path]
+            else:
+                return '!s{' + path + '}'
 
-        # a simple constant
-        return expression
+        return None
 
     # processes the current line.
     def process_line(self):
@@ -324,56 +391,56 @@ class Function:
 
         self.auxcommands = []
         line = self.lines[self.pointer][1]
-        tokens = tokenize(line)
+        tokens = self.line_tokens(self.pointer)
+        first = tokens[0].text
 
-        funcpath = self.function_path(tokens[0].strip())
-        destpath = self.reference_path(tokens[0].strip())
+        funcpath = self.function_path(first)
+        destpath = self.reference_path(first)
 
-        # creating a new assignment
-        if len(tokens) > 1 and (tokens[1] == '=' or tokens[1] == ' ' and tokens[2] == '='):
+        if self.known and not self.integer_statement(tokens, line, destpath):
+            self.forget()
 
-            equalspos = tokens.index('=')
+        # creating a new assignment
+        if len(tokens) > 1 and tokens[1].text == '=':
 
-            if len(tokens) == equalspos+1:
+            if len(tokens) == 2:
                 self.raise_exception('Expected something after "=".')
 
-            destdata = tokens[0].strip().split('#')
-            dest = self.reference_path(destdata[0])
-
-            clarifiers = ''
-            if len(destdata) == 2:
-                clarifiers = destdata[1]
+            clarifiers = tokens[0].clarifiers or ''
+            dest = self.reference_path(tokens[0].value)
 
             # assigning something for the first time
             if dest is None:
-                dest = self.name + '.' + destdata[0]
+                dest = self.name + '.' + tokens[0].value
                 self.locals.append(dest)
 
             # clearing an old assignment
             else:
                 if self.refs[dest] in ('e', 'p', '1', '1p', 'p1'):  # an entity
-                    self.add_command(clear_tag(dest))
+                    self.clear_tags([(dest, self.refs[dest])])
                 elif self.refs[dest] == 's':  # a string
                     self.raise_exception('Strings are handled at compile time, so overwriting a string may produce undefined behavior.')
                 else:  # something else
                     pass
 
             # evaluate the right side, perform the new assignment
-            expression = self.process_tokens(tokens[equalspos+1:], True, dest=dest)
-            refpath = self.reference_path((''.join(tokens[equalspos+1:])).strip())
+            expression = self.process_tokens(tokens[2:], True, dest=dest)
+            refpath = self.reference_path(line[tokens[2].start:].strip())
 
             if clarifiers == '':
 
                 if valid_int(expression):  # an integer constant
                     self.refs[dest] = 'i'
                     self.namespace.add_int(dest)
-                    self.add_command(assign_int(expression, dest, self.namespace))
+                    if not self.fold(dest, int(expression)):
+                        self.add_command(assign_int(expression, dest, self.namespace))
 
                 elif refpath in self.refs and self.refs[refpath] == 'i':  # an integer variable
 
                     self.refs[dest] = 'i'
                     self.namespace.add_int(dest)
-                    self.add_command(augment_int(dest, refpath, '=', self.namespace))
+                    if not self.fold(dest, self.known.get(refpath)):
+                        self.add_command(augment_int(dest, refpath, '=', self.namespace))
 
                 elif expression[0] == '@':  # an entity
 
@@ -413,13 +480,15 @@ class Function:
                 if valid_int(expression):  # an integer constant
                     self.refs[dest] = 'i'
                     self.namespace.add_int(dest)
-                    self.add_command(assign_int(expression, dest, self.namespace))
+                    if not self.fold(dest, int(expression)):
+                        self.add_command(assign_int(expression, dest, self.namespace))
 
                 elif refpath in self.refs and self.refs[refpath] == 'i':  # an integer variable
 
                     self.refs[dest] = 'i'
                     self.namespace.add_int(dest)
-                    self.add_command(augment_int(dest, refpath, '=', self.namespace))
+                    if not self.fold(dest, self.known.get(refpath)):
+                        self.add_command(augment_int(dest, refpath, '=', self.namespace))
 
                 else:
                     self.raise_exception('"' + expression + '" is not a valid integer or integer variable.')
@@ -432,19 +501,19 @@ class Function:
                 self.raise_exception('Unknown clarifier: "%s"' % clarifiers)
 
         # augmented assignment (for entities)
-        elif len(tokens) > 2 and tokens[1] in (
-                '+', '-') and tokens[2] == '=' and destpath is not None and self.refs[destpath] in ('e', 'p', '1', '1p', 'p1'):
+        elif len(tokens) > 2 and tokens[1].text in (
+                '+=', '-=') and destpath is not None and self.refs[destpath] in ('e', 'p', '1', '1p', 'p1'):
 
-            expression = self.process_tokens(tokens[3:], True, dest=destpath)
+            expression = self.process_tokens(tokens[2:], True, dest=destpath)
             if expression[0] != '@':
                 self.raise_exception('"' + expression + '" is not a valid entity.')
 
-            if tokens[1] == '+':
+            if tokens[1].text == '+=':
 
                 if expression != '@':
                     self.add_command(assign_entity(expression, destpath))
 
-            if tokens[1] == '-':
+            if tokens[1].text == '-=':
 
                 if expression != '@':
                     self.add_command(remove_entity(expression, destpath))
@@ -452,33 +521,26 @@ class Function:
 
 
         # augmented assignment (for integers)
-        elif len(tokens) > 2 and (
-                tokens[1] in ('+', '-', '/', '*', '%') and tokens[2] == '=' or tokens[1].strip() in ('<', '>', '><')):
-
-            if tokens[1] in ('+', '-', '/', '*', '%'):
-                op = tokens[1] + tokens[2]
-                expression = (''.join(tokens[3:])).strip()
-            elif tokens[1] == '>':
-                if tokens[2] == '<':
-                    op = tokens[1] + tokens[2]
-                    expression = (''.join(tokens[3:])).strip()
-                else:
-                    op = tokens[1].strip()
-                    expression = (''.join(tokens[2:])).strip()
-
-            else:
-                op = tokens[1].strip()
-                expression = (''.join(tokens[2:])).strip()
+        elif len(tokens) > 1 and tokens[1].text in ('+=', '-=', '/=', '*=', '%=', '<', '>', '><'):
 
+            op = tokens[1].text
             if len(tokens) == 2:
                 self.raise_exception('Expected something after "' + op + '"')
+            expression = line[tokens[2].start:].strip()
 
             dest = destpath
             if dest is None or self.refs[dest] != 'i':
-                self.raise_exception('Cannot perform augmented assignment on "' + tokens[0].strip() + '"')
+                self.raise_exception('Cannot perform augmented assignment on "' + first + '"')
 
             inref = self.reference_path(expression)
-            if inref is None and valid_int(expression):  # int constant
+            if inref is None and valid_int(expression):
+                value = int(expression)
+            else:
+                value = self.known.get(inref)
+            if self.fold(dest, fold_operation(self.known.get(dest), op, value)):
+                pass
+
+            elif inref is None and valid_int(expression):  # int constant
                 if op == '+=':
                     self.add_command(add_int(expression, dest, self.namespace))
                 elif op == '-=':
@@ -493,27 +555,34 @@ class Function:
             # valid variable
             else:
                 self.add_command(augment_int(dest, inref, op, self.namespace))
+                if op == '><':
+                    self.known.pop(inref, None)
 
         # increment / decrement
-        elif len(tokens) > 2 and ''.join(tokens[1:]) in ('++', '--'):
+        elif len(tokens) == 2 and tokens[1].text in ('++', '--'):
 
-            var = tokens[0].strip()
-            ref = self.reference_path(var)
+            ref = self.reference_path(first)
             if ref == None:
-                self.raise_exception('Cannot perform augmented assignment on "' + var + '"')
-            elif ''.join(tokens[1:]) == '++':
+                self.raise_exception('Cannot perform augmented assignment on "' + first + '"')
+            elif self.fold(ref, fold_operation(self.known.get(ref), '+=' if tokens[1].text == '++' else '-=', 1)):
+                pass
+            elif tokens[1].text == '++':
                 self.add_command(add_int('1', ref, self.namespace))
             else:
                 self.add_command(sub_int('1', ref, self.namespace))
 
         # definining a new function
-        elif tokens[0].strip() == 'def':
+        elif first == 'def':
 
-            func = self.functions[self.name + '.' + tokens[1].strip()]
+            func = self.functions[self.name + '.' + tokens[1].text]
             func.refs.update(self.refs)
-            if not func.instantiable:
-                func.compile()
-                func.used = True
+            if self.infunc is not None:
+                if not func.instantiable:
+                    func.compile()
+            elif self.namespace.deferred is not None:  # compiled by Namespace.require once something calls it
+                self.namespace.deferred[func.name] = func
+            else:  # a top-level def, which may be reused from the previous build
+                self.namespace.compile_unit(func)
 
         # calling a custom function
         elif funcpath is not None:
@@ -525,61 +594,61 @@ class Function:
             func = self.functions[funcpath]
             paramlist = tuple(func.params.keys())
 
-            givenparams = broad_tokenize(''.join(tokens[1:]))
             funcdata = []
             paramindex = 0
 
             entitytags = []
 
-            def add_param(p, expression, entitytags):
+            def add_param(p, param, expression, entitytags):
                 if func.params[p] in ('e', 'p', '1', '1p', 'p1'): # expecting an entity
                     self.add_command(assign_entity(expression, func.name + '.' + p))
-                    entitytags.append(func.name + '.' + p)
+                    entitytags.append((func.name + '.' + p, func.params[p]))
 
                 elif func.params[p] == 'i': # expecting an integer
                     if expression.isdigit():  # constant int
                         self.add_command(assign_int(expression, func.name + '.' + p, self.namespace))
                     elif expression[0] == '@':  # reference to int
                         self.add_command(
-                            augment_int(func.name + '.' + p, self.reference_path(givenparams[i]), '=', self.namespace))
+                            augment_int(func.name + '.' + p, self.reference_path(param), '=', self.namespace))
 
                 elif func.params[p] == 's': # expecting a string
-                    funcdata.append(self.process_tokens(tokenize(expression)))
+                    funcdata.append(expression)
 
-            for param in givenparams:
-                expression = self.process_tokens(tokenize(param)).strip()
+            for arg in split_arguments(tokens[1:]):
+                param = join_tokens(arg)
+                expression = self.process_tokens(arg)
 
                 if paramindex >= len(func.params): # expecting a sub-function
 
                     funcpath += '.' + param
                     if not funcpath in self.functions:
                         self.raise_exception('"' + param + '" is not a valid sub-function of function "' + \
-                                             tokens[0].strip() + '".')
+                                             first + '".')
                     func = self.functions[funcpath]
                     paramlist = tuple(func.params.keys())
                     paramindex = 0
 
                 else:
-                    add_param(paramlist[paramindex], expression, entitytags)
+                    add_param(paramlist[paramindex], param, expression, entitytags)
                     paramindex += 1
 
             while paramindex < len(func.params):
                 if paramlist[paramindex] in func.defaults:
-                    expression = self.process_tokens(tokenize(func.defaults[paramlist[paramindex]]))
-                    add_param(paramlist[paramindex], expression, entitytags)
+                    param = func.defaults[paramlist[paramindex]]
+                    expression = self.process_tokens(self.namespace.linecache.tokens(param))
+                    add_param(paramlist[paramindex], param, expression, entitytags)
                     paramindex += 1
                 else:
                     self.raise_exception('Not enough parameters for function "' + func.name[5:] + '".')
 
             self.add_command(self.call_function(funcpath, *funcdata))
-            for tag in entitytags:
-                self.add_command(clear_tag(tag))
+            self.clear_tags(entitytags)
 
         # implicit execute
-        elif tokens[0].strip() in (
+        elif first in (
                 'as', 'at', 'positioned', 'align', 'facing', 'rotated', 'in', 'anchored', 'if', 'unless', 'store'):
-            if tokens[-1] == ':':
-                tokens.pop()  # remove a trailing ':'
+            if tokens[-1].text == ':':
+                tokens = tokens[:-1]  # remove a trailing ':'
 
             funcname = self.fork_function('e')
             # setup execution call
@@ -590,12 +659,12 @@ class Function:
             self.check_break(funcname)
 
         # else
-        elif tokens[0].strip() == 'else':
-            if tokens[-1] == ':':
-                tokens.pop()  # remove a trailing ':'
+        elif first == 'else':
+            if tokens[-1].text == ':':
+                tokens = tokens[:-1]  # remove a trailing ':'
 
-            pastline = tokenize(self.pastline)
-            if len(pastline) == 0 or not pastline[0].strip() in (
+            pastline = self.pastline
+            if len(pastline) == 0 or not pastline[0].text in (
                 'as', 'at', 'positioned', 'align', 'facing', 'rotated', 'in', 'anchored', 'if', 'unless', 'store', 'else'):
                 self.raise_exception('"else" without a matching execution block.')
 
@@ -604,12 +673,14 @@ class Function:
 
             # we know the pastline is valid, otherwise it would have already thrown an exception last time
             pastfuncname = self.function_path('e'+str(self.relcounter-2))
-            entity = '@e[tag=' + funcname + '.ELSE]'
-            summon = 'execute unless entity ' + entity + ' run summon area_effect_cloud 0 0 0 {Age:-2147483648,Duration:-1,WaitTime:-2147483648,Tags:["' + \
-                funcname + '.ELSE"]}'
+            flag = self.flag(funcname + '.ELSE')
+            if self.namespace.flags == 'entity':  # only one entity should hold the flag
+                summon = 'execute unless ' + check_flag(flag, self.namespace) + ' run ' + set_flag(flag, self.namespace)
+            else:
+                summon = set_flag(flag, self.namespace)
             self.functions[pastfuncname].commands.insert(0, summon)
 
-            call = 'execute unless entity ' + entity + ' '
+            call = 'execute unless ' + check_flag(flag, self.namespace) + ' '
 
             # add additional execute params to the call
             params = self.process_tokens(tokens[1:], False, True)
@@ -620,13 +691,13 @@ class Function:
             for c in self.auxcommands:
                 self.commands.append(c)
             self.add_command(call)
-            self.add_command('kill '+ entity)
+            self.add_command(clear_flag(flag, self.namespace))
             self.check_break(funcname)
 
         # repeat
-        elif tokens[0].strip() == 'repeat':
+        elif first == 'repeat':
 
-            count = ''.join(tokens[1:]).strip().strip(':')
+            count = line[tokens[0].end:].strip().strip(':')
 
             try:
                 count = int(count)
@@ -635,23 +706,27 @@ class Function:
 
             funcname = self.fork_function('r')
             # setup execution call
-            for i in range(count):
-                self.add_command(self.call_function(funcname))
+            if count > self.namespace.repeatthreshold:
+                for chain in self.repeat_chain(funcname, count):
+                    self.add_command(self.call_function(chain))
+            else:
+                for i in range(count):
+                    self.add_command(self.call_function(funcname))
             self.check_break(funcname)
 
         # while loop
-        elif tokens[0].strip() in ('while', 'whilenot', 'loop'):
-            if tokens[-1] == ':':
-                tokens.pop()  # remove a trailing ':'
+        elif first in ('while', 'whilenot', 'loop'):
+            if tokens[-1].text == ':':
+                tokens = tokens[:-1]  # remove a trailing ':'
 
             funcname = self.fork_function('w')
             # setup execution call
-            if tokens[1] == ':':
-                tokens.pop(1)
+            if len(tokens) > 1 and tokens[1].text == ':':
+                tokens = tokens[:1] + tokens[2:]
 
-            if tokens[0].strip() == 'loop':
+            if first == 'loop':
                 call = 'execute ' + self.process_tokens(tokens[1:], False, True) + ' run ' + self.call_function(funcname)
-            elif tokens[0].strip() == 'while':
+            elif first == 'while':
                 call = 'execute if ' + self.process_tokens(tokens[1:], False, True) + ' run ' + self.call_function(funcname)
             else:
                 call = 'execute unless ' + self.process_tokens(tokens[1:], False, True) + ' run ' + self.call_function(funcname)
@@ -662,53 +737,52 @@ class Function:
             self.add_command(call)
             self.functions[funcname].call_loop(funcname, call)
             if self.functions[funcname].hasbreak:
-                self.add_command('kill @e[tag=' + funcname + '.BREAK]')
+                self.add_command(clear_flag(self.flag(funcname + '.BREAK'), self.namespace))
             if self.functions[funcname].hascontinue:
-                self.add_command('kill @e[tag=' + funcname + '.CONTINUE]')
+                self.add_command(clear_flag(self.flag(funcname + '.CONTINUE'), self.namespace))
 
         # break
-        elif tokens[0].strip() == 'break':
+        elif first == 'break':
             if self.inloop is None:
                 self.raise_exception('"break" outside of loop.')
 
             self.hasbreak = True
-            self.add_command('summon area_effect_cloud 0 0 0 {Age:-2147483648,Duration:-1,WaitTime:-2147483648,Tags:["' + '.'.join(
-                self.inloop) + '.BREAK"]}')
+            self.add_command(set_flag(self.flag('.'.join(self.inloop) + '.BREAK'), self.namespace))
 
         # continue
-        elif tokens[0].strip() == 'continue':
+        elif first == 'continue':
             if self.inloop is None:
                 self.raise_exception('"continue" outside of loop.')
 
             self.hascontinue = True
-            self.add_command('summon area_effect_cloud 0 0 0 {Age:-2147483648,Duration:-1,WaitTime:-2147483648,Tags:["' + '.'.join(
-                self.inloop) + '.CONTINUE"]}')
+            self.add_command(set_flag(self.flag('.'.join(self.inloop) + '.CONTINUE'), self.namespace))
 
         # vanilla command
         elif self.infunc is None:
             self.raise_exception(
                 'Vanilla command outside of a function. This is not allowed, consider putting it inside the load function.')
-        elif tokens[0].strip() == 'function':
+        elif first == 'function':
             self.raise_exception(
                 'The /function command is no longer used. Just type your function as if it were a command.')
-        elif tokens[0].strip() in ('include', 'file'):
+        elif first in ('include', 'file'):
             self.raise_exception(
-                '"' + tokens[0].strip() + '" statement should not be inside of a function.')
+                '"' + first + '" statement should not be inside of a function.')
 
         else:
             self.add_command(self.process_tokens(tokens))
 
-        self.pastline = line
+        self.pastline = tokens
 
     # called on a set of tokens, intended to evaluate to a single string which represents some value which can be
     # inserted into vanilla commands. this can be an entity, integer, or series of vanilla commands (or components
     # thereof) will handle references as part of an expression.
     def process_tokens(self, tokens, augsummon=False, conditional=False, dest=None):
 
-        args = broad_tokenize(''.join(tokens).strip())
+        args = split_arguments(tokens)
+        texts = [join_tokens(arg) for arg in args]
 
         # special case: assigning as a summon
-        if augsummon and args[0] == 'summon':
+        if augsummon and texts[0] == 'summon':
             ref = self.process_tokens(tokens)
             if 'Tags:[' in ref:
                 self.add_command(ref.replace('Tags:[', 'Tags:["' + dest + '",'))
@@ -721,28 +795,29 @@ class Function:
         # special case: conditional
         if conditional and len(args) > 2:
             for i in range(1, len(args) - 1):
-                op = args[i]
-                if op in ('<', '>', '==', '<=', '>=') and (i == 1 or args[i - 2].strip() in ('if', 'unless')):
-                    refleft = self.reference_path(args[i - 1])
-                    refright = self.reference_path(args[i + 1])
+                op = texts[i]
+                if op in ('<', '>', '==', '<=', '>=') and (i == 1 or texts[i - 2] in ('if', 'unless')):
+                    refleft = self.reference_path(texts[i - 1])
+                    refright = self.reference_path(texts[i + 1])
                     varleft, varright = None, None
 
                     # left side
                     if refleft != None and self.refs[refleft] == 'i':
                         varleft = refleft
-                    elif args[i - 1].isdigit():
-                        varleft = args[i - 1]
+                    elif texts[i - 1].isdigit():
+                        varleft = texts[i - 1]
                     else:
-                        self.raise_exception('"' + args[i - 1] + '" is not a valid integer variable or constant.')
+                        self.raise_exception('"' + texts[i - 1] + '" is not a valid integer variable or constant.')
 
                     # right side
                     if refright != None and self.refs[refright] == 'i':
                         varright = refright
-                    elif args[i + 1].isdigit():
-                        varright = args[i + 1]
+                    elif texts[i + 1].isdigit():
+                        varright = texts[i + 1]
                     else:
-                        self.raise_exception('"' + args[i + 1] + '" is not a valid integer variable or constant.')
+                        self.raise_exception('"' + texts[i + 1] + '" is not a valid integer variable or constant.')
 
+                    # the comparison is already in its final form, so it replaces the tokens of the left side
                     if varleft.isdigit() and varright.isdigit():
                         self.raise_exception('Cannot compare two constants.')
                     elif varleft.isdigit():
@@ -756,20 +831,41 @@ class Function:
                         args[i - 1] = check_int(varleft + '.TEST', op, '0', self.namespace)
 
                     args[i], args[i + 1] = None, None
+                    texts[i], texts[i + 1] = None, None
+
+        out = []
+        for arg in args:
+            if arg is None:
+                continue
+            if isinstance(arg, str):
+                out.append(arg)
+                continue
 
-        tokens = tokenize(' '.join(a for a in args if a is not None))
+            pieces = []
+            narrowing = False
+            for i, token in enumerate(arg):
+                if narrowing:  # the selector before this bracket was left open
+                    piece = ','
+                    narrowing = False
+                elif token.kind == NAME:
+                    piece = self.process_reference(token.value, token.clarifiers)
+                    if piece is None:
+                        piece = token.text
+                    # narrowing
+                    elif piece[0] == '@' and i != len(arg) - 1 and arg[i + 1].text == '[' and token.space == '':
+                        piece = piece[:-1]
+                        narrowing = True
+                elif token.kind == STRING:
+                    piece = token.text[0] + self.process_expression(token.value) + token.text[1 + len(token.value):]
+                else:
+                    piece = token.text
+                pieces.append(piece)
+                if i != len(arg) - 1:
+                    pieces.append(token.space)
 
-        for i, token in enumerate(tokens):
-            refpath = self.reference_path(token.split('#')[0])
-            token = self.process_expression(token)
-            # narrowing
-            if refpath is not None and token[0] == '@' and i != len(tokens) - 1 and tokens[i + 1][0] == '[' \
-                    and tokens[i][-1] != ' ':
-                tokens[i + 1] = ',' + tokens[i + 1][1:]
-                token = token[:-1]
-            tokens[i] = token
+            out.append(''.join(pieces))
 
-        return (''.join(tokens)).strip()
+        return ' '.join(out).strip()
 
     # <code> refers to the type of function. These are the same codes as are used in function path/file names.
     # 'w' = while loop body
@@ -777,6 +873,7 @@ class Function:
     # 'r' = repeat loop body
     # 'b' = chained continue/break-check function
     # 's' = forked string function (not used in this function)
+    # 'c' = doubling chain of a repeat loop body (not used in this function)
     # returns the name of the function which was generated
     def fork_function(self, code):
 
@@ -802,11 +899,11 @@ class Function:
         funcname = '.'.join(funcpath)
 
         try:
-            self.functions[funcname] = Function(funcpath, self.refs, {}, {}, self.lines, self.namespace, newpointer, newdepth,
-                                                self.infunc, inloop, self.stringdata)
+            self.namespace.add_function(Function(funcpath, self.refs, {}, {}, self.lines, self.namespace, newpointer, newdepth,
+                                                 self.infunc, inloop, self.stringdata))
             # if this is a break-chain, we should carry over the pastline because its the same level of indentation
             if code == 'b':
-                self.functions[funcname].pastline = self.lines[self.pointer][1]
+                self.functions[funcname].pastline = self.line_tokens(self.pointer)
             self.functions[funcname].compile()
         except CompilationSyntaxError as e:
             if code != 'b':
@@ -815,6 +912,21 @@ class Function:
         self.relcounter += 1
         return funcname
 
+    # returns functions which together run the repeat loop body <funcname> <count> times, to be called one after the
+    # other. The n-th function of the chain runs the body 2^n times by calling the one before it twice, so this
+    # takes O(log count) commands instead of <count>.
+    def repeat_chain(self, funcname, count):
+
+        chain = [funcname]
+        while 2 ** len(chain) <= count:
+            func = Function(funcname.split('.') + ['c' + str(len(chain))], self.refs, {}, {}, [], self.namespace, 0, 0,
+                            self.infunc, self.inloop, self.stringdata)
+            func.commands = [self.call_function(chain[-1])] * 2
+            self.namespace.add_function(func)
+            chain.append(func.name)
+
+        return [chain[n] for n in range(len(chain) - 1, -1, -1) if count >> n & 1]
+
     # this will call a sub-function of name <funcname>
     def call_function(self, funcname, *funcdata):
 
@@ -837,11 +949,11 @@ class Function:
 
             if func.hasbreak:
                 self.hasbreak = True
-                call += 'unless entity @e[tag=' + '.'.join(self.inloop) + '.BREAK] '
+                call += 'unless ' + check_flag(self.flag('.'.join(self.inloop) + '.BREAK'), self.namespace) + ' '
 
             if func.hascontinue:
                 self.hascontinue = True
-                call += 'unless entity @e[tag=' + '.'.join(self.inloop) + '.CONTINUE] '
+                call += 'unless ' + check_flag(self.flag('.'.join(self.inloop) + '.CONTINUE'), self.namespace) + ' '
 
             # if fork isn't in self.functions, then it was collapsed and we don't have to worry about it.
             if fork in self.functions and len(self.functions[fork].commands) > 0:
@@ -868,21 +980,29 @@ class Function:
         # if the loop has a break/continue, we need to ensure it hasn't been called before looping again
         if func.hasbreak or func.hascontinue:
 
-            if func.hasbreak:
-                newcall = 'unless entity @e[tag=' + '.'.join(self.inloop) + '.BREAK] run ' + newcall
-
+            conditions = []
             if func.hascontinue:
-                newcall = 'unless entity @e[tag=' + '.'.join(self.inloop) + '.CONTINUE] run ' + newcall
+                conditions.append('unless ' + check_flag(self.flag('.'.join(self.inloop) + '.CONTINUE'), self.namespace))
 
-            newcall = 'execute ' + newcall
+            if func.hasbreak:
+                conditions.append('unless ' + check_flag(self.flag('.'.join(self.inloop) + '.BREAK'), self.namespace))
+
+            newcall = 'execute ' + ' '.join(conditions) + ' run ' + newcall
 
         func.commands.append(newcall)
 
         # if the loop has a continue,
         # we need to reset it to the beginning if we reach the end and continue has been called
         if self.functions[funcname].hascontinue:
-            cmd = 'kill @e[tag=' + '.'.join(self.inloop) + '.CONTINUE]'
-            self.functions[funcname].commands.insert(0, cmd)
+            flag = self.flag('.'.join(self.inloop) + '.CONTINUE')
+            self.functions[funcname].commands.insert(0, clear_flag(flag, self.namespace))
 
-            cmd = 'execute if entity @e[tag=' + '.'.join(self.inloop) + '.CONTINUE] run ' + call
+            cmd = 'execute if ' + check_flag(flag, self.namespace) + ' run ' + call
             self.functions[funcname].commands.append(cmd)
+
+    # returns the control flow flag <name>, registering its integer variable if flags are kept on the scoreboard
+    def flag(self, name):
+
+        if self.namespace.flags == 'scoreboard':
+            self.namespace.add_int(name)
+        return name
@@ -0,0 +1,149 @@
+import os
+import stat
+
+
+# the graph of source files making up a datapack: the files it was given, every file they include, and every file
+# they copy into the output. Each path is resolved and stat-ed once, and files are identified by device and inode,
+# so a file which is included twice, or which is part of an include cycle, is only read once.
+class IncludeGraph:
+
+    def __init__(self):
+
+        # every source file, in the order it was discovered
+        self.files = []
+
+        # source files which were only reached through an include statement
+        self.included = []
+
+        # an entry follows this format: {path : [included path, ...]}. Includes of missing files are left out.
+        self.includes = {}
+
+        # include statements which pointed at a file that was already loaded, as (including path, included path)
+        self.duplicates = []
+
+        # the lines of each file, minus include and file statements: {path : [(line index, line), ...]}
+        self.sources = {}
+
+        # files to copy into the datapack, follows this format: {source path : destination}
+        self.copies = {}
+
+        # directories whose whole contents are copied into the datapack
+        self.directories = []
+
+        # included or copied paths which don't exist
+        self.missing = []
+
+        # cached os.stat results, None for paths which don't exist: {path : stat_result}
+        self.stats = {}
+
+        # {(st_dev, st_ino) : path} for every file in self.files
+        self.identities = {}
+
+    def stat(self, path):
+
+        if path not in self.stats:
+            try:
+                self.stats[path] = os.stat(path)
+            except OSError:
+                self.stats[path] = None
+        return self.stats[path]
+
+    def isfile(self, path):
+
+        st = self.stat(path)
+        return st is not None and stat.S_ISREG(st.st_mode)
+
+    # adds a source file to the graph. Returns the path it was added under, which is the path of the already loaded
+    # file if <path> is a duplicate, or None if it doesn't exist.
+    def add(self, path, included=False):
+
+        path = os.path.abspath(path)
+        if not self.isfile(path):
+            return None
+
+        st = self.stats[path]
+        identity = (st.st_dev, st.st_ino)
+        if identity in self.identities:
+            return self.identities[identity]
+
+        self.identities[identity] = path
+        self.files.append(path)
+        self.includes[path] = []
+        if included:
+            self.included.append(path)
+        return path
+
+    # handles an include statement in the file <source>
+    def include(self, source, path):
+
+        if not path.endswith('.mcf'):
+            path += '.mcf'
+        path = os.path.abspath(path)
+
+        known = len(self.files)
+        resolved = self.add(path, True)
+
+        if resolved is None:
+            print('failed to import "' + path + '".')
+            self.missing.append(path)
+            return
+
+        self.includes[source].append(resolved)
+        if len(self.files) == known:
+            self.duplicates.append((source, resolved))
+        else:
+            print('importing "' + path + '"...')
+
+    # handles a file statement, copying <path> into the folder <dest> of the datapack
+    def copy(self, path, dest):
+
+        path = os.path.abspath(path)
+        if path.endswith('*'):
+            self.directories.append(path[:-1])
+            paths = [os.path.join(path[:-1], f) for f in os.listdir(path[:-1])]
+        else:
+            paths = [path]
+
+        for p in paths:
+            if self.isfile(p):
+                self.copies[p] = dest
+            else:
+                print('file "' + p + '" does not exist.')
+                self.missing.append(p)
+
+    # reads every file in the graph, following include statements as they are found.
+    def resolve(self):
+
+        i = 0
+        while i < len(self.files):
+            path = self.files[i]
+            base = os.path.dirname(path)
+            lines = self.sources[path] = []
+
+            with open(path, 'r') as f:
+                for j, line in enumerate(f):
+                    if line.startswith('include '):
+                        self.include(path, os.path.join(base, line[8:].strip()))
+                    elif line.startswith('file '):
+                        components = line.split()[1:]
+                        if len(components) == 2:
+                            self.copy(os.path.join(base, components[0]), components[1])
+                        else:
+                            print('"file" command takes 2 parameters, incorrect number supplied.')
+                    else:
+                        lines.append((j, line))
+
+            i += 1
+
+    # returns the lines of every file as one list. Files discovered later come first.
+    def lines(self):
+
+        rawlines = []
+        for path in reversed(self.files):
+            rawlines.extend(self.sources[path])
+        return rawlines
+
+    # returns every path a change to which could change the datapack
+    def watched(self):
+
+        return self.files + list(self.copies) + self.directories + self.missing
@@ -0,0 +1,218 @@
+import re
+
+from .reader import *
+
+# anything in a line which could be the name of a def
+IDENT = re.compile(r'\w+')
+
+
+# keeps the output of one build in memory so that the next build only has to recompile what changed.
+# the unit of recompilation is a top-level def together with everything nested inside it, plus the string function
+# clones made from it while linking. A unit depends on its own lines, and on the headers of the defs whose names it
+# mentions, since that is how it calls them: it is recompiled when either changes, or when a def by one of those
+# names is added or removed. Lines shared by every def, like top-level statements and build options, make up the
+# context, and changing them recompiles everything. Linking always runs again over the whole namespace.
+
+
+# the saved state of one top-level def
+class Unit:
+
+    def __init__(self, key):
+
+        # the (tab-depth, content) of every line of the def, used to detect changes
+        self.key = key
+
+        # the functions generated for this def before linking, as (Function, commands)
+        self.functions = []
+
+        # calls made to Namespace.add_int and Namespace.add_constant while compiling, as (kind, value)
+        self.journal = []
+
+        # an entry follows this format: {clone name : (stringdata, journal of the instantiation)}
+        self.clones = {}
+
+
+class BuildCache:
+
+    def __init__(self):
+
+        # the saved state of the previous successful build. Constants which that build didn't use are None, so that
+        # the others keep their index.
+        self.context = None
+        self.units = {}
+        self.intmap = {}
+        self.intcount = 0
+        self.consts = []
+
+        # the include graph of the latest build, even if it failed
+        self.graph = None
+
+        # the state of the build in progress, which replaces the above when it finishes
+        self.keys = {}
+        self.next = {}
+
+        # tokens of every source line of the previous build, and of the build in progress: {line : tokens}
+        self.lexed = {}
+        self.nextlexed = {}
+
+        # names of the units which were restored instead of compiled in the build in progress
+        self.reused = set()
+
+        # statistics of the build in progress
+        self.unitcount = 0
+        self.clonecount = 0
+        self.reusedclones = 0
+
+    # returns the tokens of the source line <line>, lexing it only if the previous build didn't contain it.
+    # the returned list is shared, and must not be modified.
+    def lex(self, line):
+
+        tokens = self.lexed.get(line)
+        if tokens is None:
+            tokens = lex(line)
+        self.nextlexed[line] = tokens
+        return tokens
+
+    # called once the source lines of a build are known. Works out the key of every unit, see the top of this file.
+    # When the context changes, nothing is reused.
+    def begin(self, namespace, lines):
+
+        context = [namespace.pack, namespace.fold, namespace.scores, namespace.flags, namespace.repeatthreshold,
+                   namespace.narrowtags]
+        self.keys = {}
+        self.next = {}
+        self.reused = set()
+        self.unitcount = 0
+        self.clonecount = 0
+        self.reusedclones = 0
+
+        # the header lines of every def, top-level or nested: {name : [(tab-depth, content), ...]}
+        headers = {}
+        # the lines of every unit: {Function.name : (start, end)}
+        spans = {}
+
+        name, start = None, 0
+        for i, (td, line, n) in enumerate(lines):
+            if td == 0:
+                if name is not None:
+                    spans[name] = (start, i)
+                    name = None
+                if line.startswith('def '):
+                    tokens = namespace.linecache.tokens(line, n)
+                    if len(tokens) > 1:
+                        name, start = 'main.' + tokens[1].text, i
+            if line.startswith('def '):
+                tokens = namespace.linecache.tokens(line, n)
+                headers.setdefault(tokens[1].text if len(tokens) > 1 else '', []).append((td, line))
+            elif td == 0:
+                context.append((td, line))
+        if name is not None:
+            spans[name] = (start, len(lines))
+
+        for name, (start, end) in spans.items():
+            own = tuple((l[0], l[1]) for l in lines[start:end])
+            mentioned = set(IDENT.findall('\n'.join(l[1] for l in own)))
+            self.keys[name] = (own, tuple((d, tuple(headers[d])) for d in sorted(mentioned & set(headers))))
+
+        if context != self.context:
+            self.units = {}
+        self.context = context
+
+        # keep objective and constant names stable between builds
+        namespace.intmap.update(self.intmap)
+        namespace.intcount = max(namespace.intcount, self.intcount)
+        namespace.consts.extend(self.consts)
+
+    # compiles the top-level def <func>, or restores it from the previous build if it hasn't changed.
+    # returns the function now registered under its name.
+    def compile_unit(self, namespace, func):
+
+        self.unitcount += 1
+        key = self.keys.get(func.name)
+        unit = self.units.get(func.name)
+
+        if unit is not None and unit.key == key:
+            self.reused.add(func.name)
+            reused = self.next[func.name] = Unit(key)
+            reused.journal = unit.journal
+            reused.functions = unit.functions
+            if not func.instantiable:
+                self.restore(namespace, [('function', f) for f in unit.functions] + unit.journal)
+            return namespace.functions[func.name]
+
+        unit = self.next[func.name] = Unit(key)
+        if not func.instantiable:
+            namespace.journal = []
+            func.compile()
+            unit.journal = [event for event in namespace.journal if event[0] != 'function']
+            namespace.journal = None
+
+            # nothing else changes these functions until they are linked
+            for name in namespace.units[func.name]:
+                f = namespace.functions[name]
+                unit.functions.append((f, tuple(f.commands)))
+        return func
+
+    # instantiates the string function clone <name> of <func> from the previous build, if <func> hasn't changed and
+    # the clone was made with the same <stringdata>. Returns whether the clone was restored.
+    def restore_clone(self, namespace, func, name, stringdata):
+
+        self.clonecount += 1
+        unitname = '.'.join(func.path[:2])
+        if unitname not in self.reused:
+            return False
+
+        clone = self.units[unitname].clones.get(name)
+        if clone is None or clone[0] != stringdata:
+            return False
+
+        self.next[unitname].clones[name] = clone
+        self.restore(namespace, clone[1])
+        self.reusedclones += 1
+        return True
+
+    # saves the string function clone <name> of <func>. <journal> holds what happened while instantiating it.
+    def record_clone(self, func, name, stringdata, journal):
+
+        unit = self.next.get('.'.join(func.path[:2]))
+        if unit is None:
+            return
+
+        events = []
+        for kind, value in journal:
+            if kind == 'function':
+                value = (value, tuple(value.commands))
+            events.append((kind, value))
+        unit.clones[name] = (stringdata, events)
+
+    # replays the journal <events> of a previous build onto <namespace>
+    def restore(self, namespace, events):
+
+        for kind, value in events:
+            if kind == 'function':
+                func, commands = value
+                func.namespace = namespace
+                func.functions = namespace.functions
+                func.commands = list(commands)
+                func.instancecounter = 0
+                namespace.add_function(func)
+            elif kind == 'int':
+                namespace.add_int(value)
+            elif kind == 'constant':
+                namespace.add_constant(value)
+
+    # called once a build has succeeded
+    def finish(self, namespace):
+
+        self.units = self.next
+        self.next = {}
+        self.lexed = self.nextlexed
+        self.nextlexed = {}
+
+        # only what this build used is carried over, so that deleted or renamed variables don't keep their names
+        live = set(namespace.ints) | set('CONSTANT.' + str(i) for i in namespace.liveconsts)
+        self.intmap = {ref: objective for ref, objective in namespace.intmap.items() if ref in live}
+        self.intcount = namespace.intcount
+        self.consts = [value if i in namespace.liveconsts else None for i, value in enumerate(namespace.consts)]
+        while self.consts and self.consts[-1] is None:
+            self.consts.pop()
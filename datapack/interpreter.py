@@ -0,0 +1,776 @@
+import json
+import math
+import random
+import re
+from collections import deque
+
+from .commands import wrap
+
+# the most commands one call of a function may run before the game stops it, like its maxCommandChainLength
+MAX_CHAIN_LENGTH = 65536
+
+# where simulated players stand, and how far apart
+PLAYER_SPACING = 2
+
+TAGS = re.compile(r'Tags:\[([^\]]*)\]')
+NAME = re.compile(r'CustomName:("(?:[^"\\]|\\.)*"|\'(?:[^\'\\]|\\.)*\')')
+
+
+class InterpreterError(Exception):
+    pass
+
+
+class Entity:
+
+    def __init__(self, type, pos=(0.0, 0.0, 0.0), tags=(), name=None):
+
+        self.type = type
+        self.pos = pos
+        self.tags = set(tags)
+        self.name = name
+
+    # the name shown for this entity in text
+    def display(self):
+        return self.name if self.name is not None else self.type
+
+    def __repr__(self):
+        return '%s(%s)' % (self.type, ', '.join(sorted(self.tags)))
+
+
+# reads the arguments of a command one at a time. Arguments are separated by spaces, except inside brackets, braces
+# and quotes, so that a selector or NBT with spaces in it is one argument.
+class Reader:
+
+    def __init__(self, text):
+
+        self.text = text
+        self.index = 0
+
+    def skip(self):
+
+        while self.index < len(self.text) and self.text[self.index] == ' ':
+            self.index += 1
+
+    def done(self):
+
+        self.skip()
+        return self.index >= len(self.text)
+
+    def next(self):
+
+        self.skip()
+        if self.index >= len(self.text):
+            raise InterpreterError('Expected more arguments: "%s"' % self.text)
+
+        start = self.index
+        depth = 0
+        quote = None
+        while self.index < len(self.text):
+            c = self.text[self.index]
+            if quote is not None:
+                if c == '\\':
+                    self.index += 1
+                elif c == quote:
+                    quote = None
+            elif c in '"\'':
+                quote = c
+            elif c in '[{':
+                depth += 1
+            elif c in ']}':
+                depth -= 1
+            elif c == ' ' and depth == 0:
+                break
+            self.index += 1
+        return self.text[start:self.index]
+
+    # returns everything which is left
+    def rest(self):
+
+        self.skip()
+        rest = self.text[self.index:]
+        self.index = len(self.text)
+        return rest
+
+
+# splits <text> at the commas which aren't nested in brackets or braces
+def split_top(text, separator=','):
+
+    parts = []
+    depth = 0
+    start = 0
+    for i, c in enumerate(text):
+        if c in '[{':
+            depth += 1
+        elif c in ']}':
+            depth -= 1
+        elif c == separator and depth == 0:
+            parts.append(text[start:i])
+            start = i + 1
+    parts.append(text[start:])
+    return [p.strip() for p in parts if p.strip()]
+
+
+# returns (low, high) for a range like "1", "1..", "..5" or "1..5", either side being None if it is open
+def parse_range(text, number=int):
+
+    if '..' not in text:
+        return number(text), number(text)
+    low, high = text.split('..', 1)
+    return (number(low) if low else None), (number(high) if high else None)
+
+
+def in_range(value, bounds):
+    return (bounds[0] is None or value >= bounds[0]) and (bounds[1] is None or value <= bounds[1])
+
+
+# strips the minecraft: prefix from the id <name>, and any block states after it
+def resource(name):
+
+    name = name.split('[', 1)[0].split('{', 1)[0]
+    if name.startswith('minecraft:'):
+        return name[10:]
+    return name
+
+
+# returns the string held by the SNBT string <text>, which is quoted
+def snbt_string(text):
+
+    out = []
+    i = 1
+    while i < len(text) - 1:
+        if text[i] == '\\':
+            i += 1
+        out.append(text[i])
+        i += 1
+    return ''.join(out)
+
+
+# returns the functions of a compiled Namespace as {'<pack>:<name>' : [command, ...]}. <hide> is the same as when it
+# was compiled.
+def compiled_functions(namespace, hide=False):
+
+    functions = {}
+    for func in namespace.functions.values():
+        functions[namespace.pack + ':' + namespace.output_name(func, hide)] = func.commands
+    return functions
+
+
+# runs the functions of a compiled datapack without Minecraft, against a simulated list of entities. Only the
+# commands this compiler emits are understood: scoreboard, tag, execute with as, at, positioned, if, unless and store,
+# function, summon, kill, tellraw and say. Any other command, selector argument or execute condition is counted
+# and otherwise ignored, or raises an InterpreterError with <strict>. Every block is <block> unless set in
+# self.blocks.
+class Interpreter:
+
+    def __init__(self, functions, players=1, seed=0, strict=False, block='air'):
+
+        # an entry follows this format: {'<pack>:<name>' : [command, ...]}
+        self.functions = functions
+        self.strict = strict
+        self.random = random.Random(seed)
+
+        # every entity, players first, in the order they were summoned
+        self.entities = [Entity('player', (float(i * PLAYER_SPACING), 0.0, 0.0), name='Player%i' % i)
+                         for i in range(players)]
+
+        # an entry follows this format: {objective : {holder : score}}, where a holder is an Entity or a name
+        self.scores = {}
+
+        # an entry follows this format: {(x, y, z) : block}, any other block is <block>
+        self.blocks = {}
+        self.block = block
+
+        # what tellraw and say printed, in order
+        self.log = []
+
+        # commands the interpreter doesn't understand, follows this format: {first word : count}
+        self.unsupported = {}
+
+        # commands which failed in a way the game would report, e.g. an unknown objective
+        self.errors = []
+
+        # the number of commands run by the call in progress, and (function, commands) for every finished call
+        self.executed = 0
+        self.calls = []
+
+        # functions called by the command running right now, as (commands, context), which run once it is done
+        self.called = []
+
+    # runs the function <name> as the server, like the load and tick function tags do. Returns the number of
+    # commands it ran, or None if there is no such function.
+    #
+    # like in the game, calls don't nest: a called function's commands are queued in front of the ones left, and run
+    # once the command calling it is done. This is also how loops, which call themselves, run without a limit on
+    # their depth.
+    def call(self, name):
+
+        if name not in self.functions:
+            return None
+
+        self.executed = 0
+        queue = deque((command, (None, (0.0, 0.0, 0.0))) for command in self.functions[name])
+        while queue:
+            command, context = queue.popleft()
+            if command == '' or command.startswith('#'):
+                continue
+            if self.executed == MAX_CHAIN_LENGTH:
+                self.errors.append('%s stopped after %i commands' % (name, MAX_CHAIN_LENGTH))
+                break
+            self.executed += 1
+
+            self.called = []
+            self.run_command(command, context)
+            for commands, context in reversed(self.called):
+                queue.extendleft((c, context) for c in reversed(commands))
+
+        self.calls.append((name, self.executed))
+        return self.executed
+
+    def unknown(self, what):
+
+        if self.strict:
+            raise InterpreterError('Unsupported: "%s"' % what)
+        word = what.split(' ', 1)[0]
+        self.unsupported[word] = self.unsupported.get(word, 0) + 1
+
+    # entities
+
+    def players(self):
+        return [e for e in self.entities if e.type == 'player']
+
+    # returns the entities <selector> picks in the context <context>
+    def select(self, selector, context):
+
+        executor, pos = context
+
+        if not selector.startswith('@'):
+            return [e for e in self.players() if e.name == selector]
+
+        kind = selector[:2]
+        arguments = []
+        if len(selector) > 2:
+            if selector[2] != '[' or selector[-1] != ']':
+                raise InterpreterError('Invalid selector: "%s"' % selector)
+            for argument in split_top(selector[3:-1]):
+                key, sep, value = argument.partition('=')
+                arguments.append((key.strip(), value.strip()))
+
+        if kind == '@s':
+            candidates = [executor] if executor is not None and executor in self.entities else []
+        elif kind in ('@a', '@p', '@r'):
+            candidates = self.players()
+        elif kind == '@e':
+            candidates = list(self.entities)
+        else:
+            raise InterpreterError('Invalid selector: "%s"' % selector)
+
+        limit = None
+        sort = {'@p': 'nearest', '@r': 'random'}.get(kind, 'arbitrary')
+        if kind in ('@p', '@r'):
+            limit = 1
+
+        for key, value in arguments:
+            if key == 'limit':
+                limit = int(value)
+            elif key == 'sort':
+                sort = value
+            else:
+                candidates = [e for e in candidates if self.matches(e, key, value, pos)]
+
+        if sort == 'nearest':
+            candidates.sort(key=lambda e: self.distance(e.pos, pos))
+        elif sort == 'furthest':
+            candidates.sort(key=lambda e: -self.distance(e.pos, pos))
+        elif sort == 'random':
+            self.random.shuffle(candidates)
+
+        if limit is not None:
+            candidates = candidates[:limit]
+        return candidates
+
+    def distance(self, a, b):
+        return math.sqrt(sum((x - y) ** 2 for x, y in zip(a, b)))
+
+    # whether the entity <e> passes the selector argument <key>=<value>, at the position <pos>
+    def matches(self, e, key, value, pos):
+
+        negated = value.startswith('!')
+        if negated:
+            value = value[1:]
+
+        if key == 'tag':
+            # "tag=" picks entities without any tag
+            result = len(e.tags) == 0 if value == '' else value in e.tags
+        elif key == 'type':
+            if value.startswith('#'):
+                self.unknown('type=' + value)
+                return True
+            result = e.type == resource(value)
+        elif key == 'name':
+            if len(value) > 1 and value[0] == value[-1] and value[0] in '"\'':
+                value = value[1:-1]
+            result = e.name == value
+        elif key == 'distance':
+            result = in_range(self.distance(e.pos, pos), parse_range(value, float))
+        elif key == 'scores':
+            result = True
+            for score in split_top(value.strip()[1:-1]):
+                objective, sep, bounds = score.partition('=')
+                current = self.scores.get(objective.strip(), {}).get(e)
+                if current is None or not in_range(current, parse_range(bounds.strip())):
+                    result = False
+        else:
+            self.unknown(key + '=')
+            return True
+
+        return result != negated
+
+    # returns the score holders <target> stands for in the context <context>, for the objective <objective>
+    def holders(self, target, context, objective=None):
+
+        if target == '*':
+            return list(self.scores.get(objective, {}))
+        if target.startswith('@'):
+            return self.select(target, context)
+        players = [e for e in self.players() if e.name == target]
+        return players if players else [target]
+
+    # text
+
+    # returns the plain text of the JSON text component <component>
+    def text(self, component, context):
+
+        if isinstance(component, str):
+            return component
+        if isinstance(component, list):
+            return ''.join(self.text(c, context) for c in component)
+        if not isinstance(component, dict):
+            return str(component)
+
+        if 'text' in component:
+            out = str(component['text'])
+        elif 'score' in component:
+            score = component['score']
+            holders = self.holders(score.get('name', ''), context, score.get('objective'))
+            value = self.scores.get(score.get('objective'), {}).get(holders[0]) if holders else None
+            out = '' if value is None else str(value)
+        elif 'selector' in component:
+            out = ', '.join(e.display() for e in self.select(component['selector'], context))
+        elif 'translate' in component:
+            out = component['translate']
+        else:
+            out = ''
+        return out + ''.join(self.text(c, context) for c in component.get('extra', []))
+
+    # commands
+
+    # queues the function <name> to run in <context> once the current command is done. Returns the number of
+    # commands in it, which is what the game gives as the result of a function command.
+    def run_function(self, name, context):
+
+        commands = self.functions.get(name)
+        if commands is None:
+            self.errors.append('Unknown function "%s"' % name)
+            return 0
+        self.called.append((commands, context))
+        return len(commands)
+
+    # runs <command> in <context> without counting it. Returns its result, which is 0 if it failed.
+    def run_command(self, command, context):
+
+        reader = Reader(command)
+        word = reader.next()
+
+        if word == 'execute':
+            return self.execute(reader, context)
+        elif word == 'function':
+            name = reader.next()
+            if name.startswith('#'):
+                self.unknown(command)
+                return 0
+            return self.run_function(name, context)
+        elif word == 'scoreboard':
+            return self.scoreboard(reader, context)
+        elif word == 'tag':
+            return self.tag(reader, context)
+        elif word == 'summon':
+            return self.summon(reader, context)
+        elif word == 'kill':
+            targets = self.select(reader.next(), context) if not reader.done() else [context[0]]
+            targets = [e for e in targets if e is not None]
+            for e in targets:
+                if e.type != 'player':
+                    self.entities.remove(e)
+            return len(targets)
+        elif word == 'tellraw':
+            targets = self.select(reader.next(), context)
+            text = reader.rest()
+            try:
+                text = self.text(json.loads(text), context)
+            except ValueError:
+                pass
+            if targets:
+                self.log.append(text)
+            return len(targets)
+        elif word == 'say':
+            executor = context[0]
+            self.log.append('[%s] %s' % ('Server' if executor is None else executor.display(), reader.rest()))
+            return 1
+
+        self.unknown(command)
+        return 0
+
+    def scoreboard(self, reader, context):
+
+        group = reader.next()
+        action = reader.next()
+
+        if group == 'objectives':
+            objective = reader.next()
+            if action == 'add':
+                if objective in self.scores:
+                    return 0
+                self.scores[objective] = {}
+                return 1
+            if action == 'remove':
+                return 1 if self.scores.pop(objective, None) is not None else 0
+            self.unknown('scoreboard objectives ' + action)
+            return 0
+
+        if group != 'players':
+            self.unknown('scoreboard ' + group)
+            return 0
+
+        targets = reader.next()
+        if action == 'reset':
+            objectives = [reader.next()] if not reader.done() else list(self.scores)
+            for objective in objectives:
+                for holder in self.holders(targets, context, objective):
+                    self.scores.get(objective, {}).pop(holder, None)
+            return 1
+
+        objective = reader.next()
+        scores = self.scores.get(objective)
+        if scores is None:
+            self.errors.append('Unknown scoreboard objective "%s"' % objective)
+            return 0
+        holders = self.holders(targets, context, objective)
+
+        if action in ('set', 'add', 'remove'):
+            value = int(reader.next())
+            for holder in holders:
+                if action == 'set':
+                    scores[holder] = wrap(value)
+                elif action == 'add':
+                    scores[holder] = wrap(scores.get(holder, 0) + value)
+                else:
+                    scores[holder] = wrap(scores.get(holder, 0) - value)
+            return scores[holders[-1]] if holders else 0
+
+        if action == 'get':
+            if len(holders) != 1 or holders[0] not in scores:
+                return 0
+            return scores[holders[0]]
+
+        if action == 'operation':
+            op = reader.next()
+            sources = self.holders(reader.next(), context)
+            other = self.scores.get(reader.next())
+            if other is None:
+                self.errors.append('Unknown scoreboard objective in "operation"')
+                return 0
+            result = 0
+            for holder in holders:
+                for source in sources:
+                    if op == '><':
+                        a, b = scores.get(holder, 0), other.get(source, 0)
+                        scores[holder], other[source] = b, a
+                        continue
+                    if source not in other:
+                        return 0
+                    b = other[source]
+                    a = scores.get(holder, 0)
+                    if op == '=':
+                        a = b
+                    elif op == '+=':
+                        a = wrap(a + b)
+                    elif op == '-=':
+                        a = wrap(a - b)
+                    elif op == '*=':
+                        a = wrap(a * b)
+                    elif op == '/=':
+                        if b == 0:
+                            continue
+                        a = wrap(a // b)
+                    elif op == '%=':
+                        if b == 0:
+                            continue
+                        a = a % b
+                    elif op == '<':
+                        a = min(a, b)
+                    elif op == '>':
+                        a = max(a, b)
+                    else:
+                        raise InterpreterError('Unknown operation "%s"' % op)
+                    scores[holder] = a
+                result = scores.get(holder, 0)
+            return result
+
+        self.unknown('scoreboard players ' + action)
+        return 0
+
+    def tag(self, reader, context):
+
+        targets = self.select(reader.next(), context)
+        action = reader.next()
+        if action == 'list':
+            return sum(len(e.tags) for e in targets)
+        tag = reader.next()
+        changed = 0
+        for e in targets:
+            if action == 'add' and tag not in e.tags:
+                e.tags.add(tag)
+                changed += 1
+            elif action == 'remove' and tag in e.tags:
+                e.tags.remove(tag)
+                changed += 1
+        return changed
+
+    def summon(self, reader, context):
+
+        type = resource(reader.next())
+        pos = context[1]
+        if not reader.done():
+            pos = self.position([reader.next(), reader.next(), reader.next()], pos)
+        nbt = reader.rest()
+
+        e = Entity(type, pos)
+        match = TAGS.search(nbt)
+        if match is not None:
+            e.tags.update(snbt_string(t.strip()) if t.strip()[:1] in '"\'' else t.strip()
+                          for t in match.group(1).split(',') if t.strip())
+        match = NAME.search(nbt)
+        if match is not None:
+            name = snbt_string(match.group(1))
+            try:
+                name = self.text(json.loads(name), context)
+            except ValueError:
+                pass
+            e.name = name
+        self.entities.append(e)
+        return 1
+
+    # returns the position of the coordinates <coordinates>, relative to <pos>. Local coordinates aren't simulated,
+    # and stay at <pos>.
+    def position(self, coordinates, pos):
+
+        out = []
+        for c, base in zip(coordinates, pos):
+            if c.startswith('^'):
+                self.unknown('^')
+                out.append(base)
+            elif c.startswith('~'):
+                out.append(base + (float(c[1:]) if len(c) > 1 else 0.0))
+            else:
+                out.append(float(c))
+        return tuple(out)
+
+    # runs the rest of an execute command, forking for every entity picked by as, at and the like. Returns the sum of
+    # the results of every branch.
+    def execute(self, reader, context):
+
+        # every branch, as (context, [(store kind, holders, objective), ...])
+        branches = [(context, [])]
+
+        while not reader.done():
+            sub = reader.next()
+
+            if sub == 'run':
+                rest = reader.rest()
+                total = 0
+                for branch, stores in branches:
+                    result = self.run_command(rest, branch)
+                    self.store(stores, result)
+                    total += result
+                return total
+
+            if sub in ('as', 'at'):
+                selector = reader.next()
+                forked = []
+                for (executor, pos), stores in branches:
+                    for e in self.select(selector, (executor, pos)):
+                        forked.append(((e, pos) if sub == 'as' else (executor, e.pos), stores))
+                branches = forked
+
+            elif sub == 'positioned':
+                first = reader.next()
+                if first == 'as':
+                    selector = reader.next()
+                    branches = [((executor, e.pos), stores) for (executor, pos), stores in branches
+                                for e in self.select(selector, (executor, pos))]
+                else:
+                    coordinates = [first, reader.next(), reader.next()]
+                    branches = [((executor, self.position(coordinates, pos)), stores)
+                                for (executor, pos), stores in branches]
+
+            elif sub in ('rotated', 'facing'):
+                first = reader.next()
+                if first in ('as', 'entity'):
+                    selector = reader.next()
+                    if first == 'entity':
+                        reader.next()
+                    branches = [((executor, pos), stores) for (executor, pos), stores in branches
+                                for e in self.select(selector, (executor, pos))]
+                else:
+                    reader.next()
+                    if sub == 'facing':
+                        reader.next()
+
+            elif sub in ('align', 'anchored', 'in'):
+                reader.next()
+
+            elif sub in ('if', 'unless'):
+                results = []
+                kept = []
+                condition = self.condition(reader)
+                if condition is None:
+                    return 0
+                for branch, stores in branches:
+                    value = condition(branch)
+                    if (value > 0) == (sub == 'if'):
+                        kept.append((branch, stores))
+                        results.append((stores, value if sub == 'if' else 1))
+                    else:
+                        self.store(stores, 0)
+                branches = kept
+                # a condition at the end is the result of the command
+                if reader.done():
+                    for stores, value in results:
+                        self.store(stores, value)
+                    return sum(value for stores, value in results)
+
+            elif sub == 'store':
+                kind = reader.next()
+                target = reader.next()
+                if target != 'score':
+                    self.unknown('execute store ' + target)
+                    return 0
+                holder = reader.next()
+                objective = reader.next()
+                branches = [(branch, stores + [(kind, self.holders(holder, branch, objective), objective)])
+                            for branch, stores in branches]
+
+            else:
+                self.unknown('execute ' + sub)
+                return 0
+
+        return len(branches)
+
+    # stores <result> as the stores of a branch ask for
+    def store(self, stores, result):
+
+        for kind, holders, objective in stores:
+            scores = self.scores.get(objective)
+            if scores is None:
+                self.errors.append('Unknown scoreboard objective "%s"' % objective)
+                continue
+            for holder in holders:
+                scores[holder] = wrap(result) if kind == 'result' else int(result != 0)
+
+    # reads the condition of an if or unless subcommand, and returns a function which gives its value in a context.
+    # Returns None if the condition isn't supported, the rest of the command can't be read then.
+    def condition(self, reader):
+
+        kind = reader.next()
+
+        if kind == 'entity':
+            selector = reader.next()
+            return lambda context: len(self.select(selector, context))
+
+        if kind == 'score':
+            target = reader.next()
+            objective = reader.next()
+            op = reader.next()
+            if op == 'matches':
+                bounds = parse_range(reader.next())
+
+                def matches(context):
+                    holders = self.holders(target, context, objective)
+                    value = self.scores.get(objective, {}).get(holders[0]) if holders else None
+                    return int(value is not None and in_range(value, bounds))
+                return matches
+
+            source = reader.next()
+            other = reader.next()
+
+            def compare(context):
+                a = self.holders(target, context, objective)
+                b = self.holders(source, context, other)
+                a = self.scores.get(objective, {}).get(a[0]) if a else None
+                b = self.scores.get(other, {}).get(b[0]) if b else None
+                if a is None or b is None:
+                    return 0
+                return int({'<': a < b, '<=': a <= b, '=': a == b, '>=': a >= b, '>': a > b}[op])
+            return compare
+
+        if kind == 'block':
+            coordinates = [reader.next(), reader.next(), reader.next()]
+            block = resource(reader.next())
+
+            def check(context):
+                pos = tuple(int(math.floor(c)) for c in self.position(coordinates, context[1]))
+                return int(self.blocks.get(pos, self.block) == block)
+            return check
+
+        self.unknown('execute if ' + kind)
+        return None
+
+
+# runs the load function of a compiled datapack once, and then its tick function <ticks> times, with <players>
+# players online. <block> is the block everywhere in the simulated world.
+class Simulation:
+
+    def __init__(self, ticks=1, players=1, seed=0, block='air', strict=False):
+
+        self.ticks = ticks
+        self.players = players
+        self.seed = seed
+        self.block = block
+        self.strict = strict
+
+        # the Interpreter of the last run
+        self.interpreter = None
+
+    def run(self, namespace, hide=False):
+
+        interpreter = self.interpreter = Interpreter(compiled_functions(namespace, hide), players=self.players,
+                                                     seed=self.seed, strict=self.strict, block=resource(self.block))
+        interpreter.call(namespace.pack + ':load')
+        for i in range(self.ticks):
+            if interpreter.call(namespace.pack + ':tick') is None:
+                break
+
+    # the number of commands of every tick
+    def tick_counts(self):
+        return [count for name, count in self.interpreter.calls if name.endswith(':tick')]
+
+    def to_text(self):
+
+        interpreter = self.interpreter
+        out = []
+        for name, count in interpreter.calls:
+            out.append('%s: %i commands' % (name, count))
+        ticks = self.tick_counts()
+        if ticks:
+            out.append('commands per tick: %.1f on average, %i at most' % (sum(ticks) / len(ticks), max(ticks)))
+
+        if interpreter.log:
+            out.extend(['', 'chat:'])
+            out.extend('\t' + line for line in interpreter.log)
+        if interpreter.unsupported:
+            out.extend(['', 'not simulated:'])
+            out.append('\t' + ', '.join('%s %i' % item for item in sorted(interpreter.unsupported.items())))
+        if interpreter.errors:
+            out.extend(['', 'errors:'])
+            out.extend('\t' + error for error in dict.fromkeys(interpreter.errors))
+        return '\n'.join(out) + '\n'
@@ -2,102 +2,247 @@ import os
 
 from .commands import *
 from .function import *
+from .callgraph import *
+from .entities import *
+from .includes import *
+from .peephole import *
+from .profile import *
 from .reader import *
+from .scope import *
+from .slots import *
+
+# plain calls to functions with at most this many commands are replaced by the commands themselves
+INLINE_THRESHOLD = 3
+
+# the most commands inlining may add to the datapack
+INLINE_BUDGET = 1000
+
+# execute subcommands which only set the position, rotation or dimension to run at, and how many arguments they take
+CONTEXT = {'positioned': 3, 'rotated': 2, 'facing': 3, 'align': 1, 'anchored': 1, 'in': 1}
+
+# commands which change nothing an execute condition could check
+OUTPUT = ('say', 'tellraw', 'title', 'playsound', 'particle', 'stopsound', 'tell', 'msg', 'w', 'me')
+
+
+# returns the part of <command> before <call> if it is "execute ... run <call>", otherwise None
+def run_prefix(command, call):
+
+    if command.startswith('execute ') and command.endswith(' run ' + call):
+        return command[:-len(call)]
+    return None
+
+
+# whether each of <commands> can be run behind the execute prefix <prefix> instead of the function they make up, which
+# re-runs the prefix for every command. That is the case when the prefix never changes @s, picks no entities and only
+# sets where to run, or when it checks conditions or runs at @s, but the commands only print something, so that the
+# prefix gives the same result every time.
+def takes_prefix(prefix, commands):
+
+    if any(command.startswith('#') for command in commands):
+        return False
+
+    tokens = words(prefix)[1:-1]
+    checks = False
+    i = 0
+    while i < len(tokens):
+        token = tokens[i]
+        following = tokens[i + 1] if i + 1 < len(tokens) else None
+        if token in ('if', 'unless'):
+            checks = True
+        elif token in ('as', 'store', 'on', 'summon') or following == 'as' or (token, following) == ('facing', 'entity'):
+            return False
+        elif token == 'at':
+            if following != '@s':
+                return False
+            checks = True
+            i += 1
+        elif token == 'positioned' and following == 'over':
+            checks = True
+            i += 2
+        elif token in CONTEXT and not checks:
+            i += CONTEXT[token]
+        elif not checks:
+            return False
+        i += 1
+
+    return not checks or all(command.split(' ', 1)[0] in OUTPUT for command in commands)
 
 
 class Namespace:
 
-    def __init__(self, pack, files):
+    def __init__(self, pack, files, cache=None):
 
         self.pack = pack
         self.files = files
 
+        # the previous build, for watch mode. See BuildCache.
+        self.cache = cache
+
+        # measures the time spent on each phase of the build while not None, see Profiler
+        self.profiler = None
+
+        # calls made to add_function, add_int and add_constant, recorded for the cache while not None
+        self.journal = None
+
         # an entry follows this format: {Function.name : Function}
         self.functions = {}
 
+        # resolves bare function names to entries of self.functions
+        self.functionindex = ScopeIndex()
+
+        # the names of the functions generated for each top-level def, in the order they were added.
+        # an entry follows this format: {top-level Function.name : [Function.name, ...]}
+        self.units = {}
+
+        # when compiling lazily, the top-level defs which haven't been compiled yet: {Function.name : Function}
+        self.deferred = None
+
+        # functions still waiting to be linked, while link() is running
+        self.worklist = None
+
+        # the calls between the functions which are left after compiling
+        self.callgraph = None
+
+        # the number of call sites replaced by the called function, and the commands this added
+        self.inlined = 0
+        self.inlinedcommands = 0
+
+        # the number of calls through execute to functions small enough to inline, which couldn't take the execute
+        self.inlineskipped = 0
+
+        # the peephole optimizer run over every function after linking
+        self.peephole = None
+
+        # whether integer statements with a value known at compile time are folded, and how many were
+        self.fold = True
+        self.folded = 0
+
+        # what holds the scores of integer variables, one of SCORES
+        self.scores = 'entity'
+
+        # how break, continue and else flags are stored, one of FLAGS
+        self.flags = 'entity'
+
+        # repeat blocks with more repetitions than this are run through a chain of functions, see
+        # Function.repeat_chain
+        self.repeatthreshold = REPEAT_THRESHOLD
+
+        # what can have the tag of each entity variable, see EntityTags, and whether tags are narrowed at all
+        self.entitytags = None
+        self.narrowtags = True
+
+        # objectives which share a slot with another one, follows this format: {objective : slot}
+        self.slots = {}
+
+        # objectives of integer variables which no command uses
+        self.unusedobjectives = []
+
         # for integer variables
         self.consts = []
         self.ints = set()
 
+        # indices of the constants used by this build, self.consts may hold some from a previous build
+        self.liveconsts = set()
+
         # to comply with objectives being no longer than 16 chars
         self.intmap = {}
 
+        # the number of entries ever added to self.intmap, which numbers the objectives of integer variables. A
+        # BuildCache carries it over along with self.intmap, so that names stay unique when it drops entries.
+        self.intcount = 0
+
         # for displaying at the end when verbose
         self.clonedfunctions = []
 
+        # string function clones, so that calls with the same strings share one.
+        # an entry follows this format: {(Function.name, ((param, value), ...)) : clone name}
+        self.instances = {}
+        self.instancecalls = 0
+
         # for copying files after compilation
         self.copyfiles = {}
 
+        # the source files and assets of the datapack, built when compiling
+        self.graph = None
+
+        # tokens of every source line, shared by all functions and their clones
+        self.linecache = LineCache(lex if cache is None else cache.lex)
+
     def add_constant(self, value):
 
+        if self.journal is not None:
+            self.journal.append(('constant', value))
+
         if value in self.consts:
+            self.liveconsts.add(self.consts.index(value))
             return 'CONSTANT.'+str(self.consts.index(value))
 
         self.consts.append(value)
+        self.liveconsts.add(len(self.consts) - 1)
         ref = 'CONSTANT.' + str(len(self.consts) - 1)
         self.intmap[ref] = ref[-16:]
+        self.intcount += 1
         return ref
 
     def add_int(self, ref):
 
+        if self.journal is not None:
+            self.journal.append(('int', ref))
+
         if ref not in self.ints:
             self.ints.add(ref)
-            self.intmap[ref] = (ref + '.' + str(len(self.intmap)))[-16:]
-
-    def add_file(self, path):
-
-        if not path.endswith('.mcf'):
-            path += '.mcf'
-        path = os.path.abspath(path)
-
-        if os.path.isfile(path) and not any(os.path.samefile(f, path) for f in self.files):
-            print('importing "' + path + '"...')
-            self.files.append(path)
-        else:
-            print('failed to import "' + path + '".')
-
-    def copy_file(self, path, dest):
-
-        path = os.path.abspath(path)
-        if path.endswith('*'):
-            paths = [os.path.join(path[:-1], f) for f in os.listdir(path[:-1])]
-        else:
-            paths = [path]
-
-        for p in paths:
-            if os.path.isfile(p):
-                self.copyfiles[p] = dest
-            else:
-                print('file "' + p + '" does not exist.')
-
-    def compile(self, verbose, hide):
-
-        rawlines = []
-
-        # read all files
+            if ref not in self.intmap:
+                self.intmap[ref] = (ref + '.' + str(self.intcount))[-16:]
+                self.intcount += 1
+
+    # registers <func> under its name. Functions should always be added through here, so they can be resolved.
+    def add_function(self, func):
+
+        if self.journal is not None:
+            self.journal.append(('function', func))
+
+        if func.name not in self.functions:
+            self.functionindex.add(func.name)
+            self.units.setdefault('.'.join(func.path[:2]), []).append(func.name)
+            if self.worklist is not None:
+                self.worklist.append(func)
+        self.functions[func.name] = func
+
+    # <lazy> only compiles the top-level defs reachable from main.load, main.tick and the functions named in
+    # <exports>, everything else is skipped. See inline for <inline> and <budget>. <peephole> are the names of the
+    # peephole rules to apply, see RULES. <fold> folds integer statements whose value is known at compile time.
+    # <scores> is what holds the scores of integer variables, one of SCORES. <share> lets integer variables which
+    # are never alive at the same time share an objective, see SlotAllocator. <flags> is how break, continue and
+    # else flags are stored, one of FLAGS. <repeat> is the most repetitions a repeat block is unrolled for.
+    # <profiler> is a Profiler to time the build with, the last phase is left running. <narrowtags> narrows the
+    # cleanup and selectors of entity variables to what they hold, see EntityTags.
+    def compile(self, verbose, hide, lazy=False, exports=(), inline=INLINE_THRESHOLD, budget=INLINE_BUDGET,
+                peephole=tuple(RULES), fold=True, scores='entity', share=True, flags='entity',
+                repeat=REPEAT_THRESHOLD, profiler=None, narrowtags=True):
+
+        self.profiler = profiler
+        self.phase('read')
+
+        self.fold = fold
+        self.scores = scores
+        self.flags = flags
+        self.repeatthreshold = repeat
+        self.narrowtags = narrowtags
+
+        # read all files, following include and file statements
+        self.graph = IncludeGraph()
+        if self.cache is not None:
+            self.cache.graph = self.graph
         for file in self.files:
-            with open(file, 'r') as f:
-                name = file.split('/')[-1].split('\\')[-1]
-                base = file.replace(name, '')
-
-                templines = []
-
-                # handle include and file statements
-                for i, line in enumerate(f.readlines()):
-                    if line.startswith('include '):
-                        newfile = line[8:].strip()
-                        path = os.path.join(base, newfile)
-                        self.add_file(path)
-                    elif line.startswith('file '):
-                        components = line.split()[1:]
-                        if len(components) == 2:
-                            self.copy_file(os.path.join(base, components[0]), components[1])
-                        else:
-                            print('"file" command takes 2 parameters, incorrect number supplied.')
-                    else:
-                        templines.append((i, line))
+            if self.graph.add(file) is None:
+                raise FileNotFoundError('source file "' + file + '" does not exist.')
+        self.graph.resolve()
+
+        self.files.extend(self.graph.included)
+        self.copyfiles.update(self.graph.copies)
+        rawlines = self.graph.lines()
 
-                rawlines = templines + rawlines # a little inefficient, but not a big deal
+        self.phase('preprocess')
 
         # auto-detect tab width
         tab_width = 4
@@ -117,81 +262,194 @@ class Namespace:
         for i, line in rawlines:
 
             td = tab_depth(line, tab_width)
-            tokens = broad_tokenize(line)
-
-            for j, token in enumerate(tokens):
-                if token == '#':
-                    line = ' '.join(tokens[:j])
-                    break
-
-            if len(line.strip()) == 0:
+            line = line.strip()
+
+            # a lone '#' argument starts a comment. Lines without one are only lexed once something reads them.
+            tokens = None
+            if '#' in line:
+                tokens = self.linecache.lexer(line)
+                for j, token in enumerate(tokens):
+                    if token.text == '#' and token.depth == 0 and (j == 0 or tokens[j - 1].splits()) \
+                            and (j == len(tokens) - 1 or token.splits()):
+                        line = line[:token.start].rstrip()
+                        tokens = tokens[:j]
+                        break
+
+            if len(line) == 0:
                 continue
 
             if td == None:
                 out = 'Error at line %i: "%s"\n\tUnknown indentation. There may be a missing or extra space character.' % (i, line.strip())
                 raise CompilationSyntaxError(out)
-            lines.append((td, line.strip(), i + 1))
+            lines.append((td, line, i + 1))
+            if tokens is not None:
+                self.linecache.store(line, i + 1, tokens)
+
+        if self.cache is not None:
+            self.cache.begin(self, lines)
 
-        main = Function(['main'], {}, {}, {}, lines, self, 0, 0, None, None, {})
+        if lazy:
+            self.deferred = {}
+
+        main = Function(['main'], SymbolTable(), {}, {}, lines, self, 0, 0, None, None, {})
+        self.phase('compiledefs')
         main.compiledefs()
+        self.phase('compile')
         main.compile()
 
+        if lazy:
+            units = len(self.deferred)
+            for name in exports:
+                if 'main.' + name not in self.functions:
+                    raise CompilationError('Exported function "' + name + '" does not exist.')
+                self.require('main.' + name)
+            for name in ('main.load', 'main.tick'):
+                self.require(name)
+
         # post-process
-        funcpointer = 0
-        while funcpointer < len(self.functions):
-            func = tuple(self.functions.values())[funcpointer]
+        self.phase('link')
+        self.link(hide)
+
+        if self.cache is not None:
+            self.cache.finish(self)
+
+        # remove every function which can't be reached from load, tick, an export or, unless compiling lazily,
+        # any def
+        roots = ['main.load', 'main.tick'] + ['main.' + name for name in exports]
+        if not lazy:
+            roots += [f.name for f in self.functions.values() if f.path == f.infunc]
+
+        self.phase('optimize')
+        if narrowtags:
+            self.entitytags = EntityTags(self)
+            self.entitytags.optimize()
+
+        self.inline(hide, roots, inline, budget)
 
-            for i, line in enumerate(func.commands):
-                func.commands[i] = self.post_process_line(line, hide)
+        self.peephole = Peephole(peephole)
+        for func in self.functions.values():
+            func.commands = self.peephole.optimize(func.commands)
 
-            funcpointer += 1
+        self.phase('prune')
+        self.callgraph = CallGraph(self, roots)
 
-        # prune unused functions
-        unused = []
-        for f in self.functions:
-            if not self.functions[f].used or len(self.functions[f].commands) == 0:
-                unused.append(f)
+        unused = self.callgraph.removed
         for f in unused:
             self.functions.pop(f)
+            self.functionindex.remove(f)
+
+        self.phase('optimize')
+        objectives = list(dict.fromkeys(self.intmap[ref] for ref in self.ints))
+        if share:
+            allocator = SlotAllocator(self, objectives)
+            self.slots = allocator.allocate()
+            self.unusedobjectives = allocator.unused
+            if self.slots:
+                for func in self.functions.values():
+                    func.commands = [allocator.rename(command) for command in func.commands]
+
+        if lazy:
+            skipped = set(f for unit in self.deferred for f in self.units[unit])
+            unused = [f for f in unused if f not in skipped]
 
         if verbose and len(unused) > 0:
             print('\ncollapsing branches...')
             print('\n\t' + ', '.join(f[5:] for f in unused if f not in self.clonedfunctions))
 
+        if verbose and lazy:
+            print('\ncompiled %i of %i definitions, skipping unreachable ones...' % (units - len(self.deferred), units))
+            if len(self.deferred) > 0:
+                print('\n\t' + ', '.join(f[5:] for f in self.deferred))
+
+        if verbose and len(self.slots) + len(self.unusedobjectives) > 0:
+            print('\nsharing objectives: %i before, %i after' % (len(objectives), len(objectives) - len(self.slots) +
+                                                                len(set(self.slots.values())) - len(self.unusedobjectives)))
+
+        if verbose and self.folded > 0:
+            print('\nfolded %i integer statements' % self.folded)
+
+        if verbose and self.entitytags is not None and self.entitytags.removed + self.entitytags.narrowed > 0:
+            print('\nentity tags: removed %i cleanups, narrowed %i commands' % (
+                self.entitytags.removed, self.entitytags.narrowed))
+
+        if verbose and self.inlined > 0:
+            print('\ninlined %i call sites, adding %i commands' % (self.inlined, self.inlinedcommands))
+
+        if verbose and self.inlineskipped > 0:
+            print('\nleft %i calls through execute which can\'t be inlined' % self.inlineskipped)
+
+        if verbose and self.peephole.removed() > 0:
+            print('\npeephole optimizer removed %i commands:' % self.peephole.removed())
+            print('\n\t' + ', '.join('%s %i' % (name, count) for name, count in self.peephole.counts.items()))
+
         if verbose and len(self.clonedfunctions) > 0:
             print('\ncloning string functions...')
             print('\n\t' + ', '.join(f[5:] for f in self.clonedfunctions))
+            print('\n\t%i calls share %i clones (%.1f calls per clone)' % (
+                self.instancecalls, len(self.clonedfunctions), self.instancecalls / len(self.clonedfunctions)))
+
+        if verbose:
+            print('\nline cache: %i hits, %i misses' % (self.linecache.hits, self.linecache.misses))
+
+        if verbose and self.cache is not None:
+            print('\nincremental build: reused %i of %i definitions, %i of %i string function clones' % (
+                len(self.cache.reused), self.cache.unitcount, self.cache.reusedclones, self.cache.clonecount))
 
         # handle scoreboard variables
         if len(self.ints) > 0:
 
             if 'main.load' not in self.functions:
                 print('\nautomatically creating missing load function...')
-                self.functions['main.load'] = Function(['main', 'load'], {}, {}, {}, [], self, 0, 0, ['main', 'load'], None, {})
+                self.add_function(Function(['main', 'load'], SymbolTable(), {}, {}, [], self, 0, 0, ['main', 'load'], None, {}))
 
             load = self.functions['main.load']
 
-            # summon the .VARS armor stand
-            commands = [summon_vars(self.pack)]
+            # summon the .VARS entity, a fake player needs nothing
+            commands = [summon_vars(self.pack)] if self.scores == 'entity' else []
 
-            for ref in self.ints:
-                commands.append('scoreboard objectives add ' + self.intmap[ref] + ' dummy')
+            for objective in dict.fromkeys(self.slots.get(o, o) for o in objectives if o not in self.unusedobjectives):
+                commands.append('scoreboard objectives add ' + objective + ' dummy')
 
             # handle constants
             for i, val in enumerate(self.consts):
+                if i not in self.liveconsts:
+                    continue
                 commands.append('scoreboard objectives add CONSTANT.' + str(i) + ' dummy')
                 commands.append(assign_int(val, 'CONSTANT.' + str(i), self))
 
             # add the new commands to the beginning of the "load" function
             load.commands = commands + load.commands
 
+        if self.profiler is not None:
+            self.profiler.count_functions(self.units)
+
         if verbose:
             print('')
             for f in self.functions:
                 print(self.functions[f])
 
+    # resolves the function calls in every function's commands. Functions which are instantiated while linking
+    # are added to the end of the worklist, so each function is visited exactly once.
+    def link(self, hide):
+
+        if self.deferred:
+            self.worklist = [f for f in self.functions.values() if '.'.join(f.path[:2]) not in self.deferred]
+        else:
+            self.worklist = list(self.functions.values())
+
+        i = 0
+        while i < len(self.worklist):
+            func = self.worklist[i]
+            func.commands = [self.post_process_line(line, hide) for line in func.commands]
+            i += 1
+
+        self.worklist = None
+
     def post_process_line(self, line, hide):
 
+        if self.deferred:
+            self.require_references(line)
+
         # function call
         index = line.find('!f{')
         if index != -1:
@@ -213,6 +471,8 @@ class Namespace:
                 index += 1
 
             callfuncname = data[0]
+            if self.deferred:
+                self.require(callfuncname)
             callfunc = self.functions[callfuncname]
 
             if len(data) > 1:  # string params
@@ -227,12 +487,9 @@ class Namespace:
                 callfuncname = self.instantiate_string_function(callfuncname, stringdata)
                 callfunc = self.functions[callfuncname]
 
-            callfuncname = callfuncname[5:]
-            if hide and callfunc.path != callfunc.infunc:
-                callfuncname = '.'.join(callfunc.infunc)[5:] + '/' + callfuncname
+            callfuncname = self.output_name(callfunc, hide)
 
             if len(callfunc.commands) > 1:
-                callfunc.used = True
                 return line[:start] + 'function ' + self.pack + ':' + callfuncname
             elif len(callfunc.commands) == 1:
                 # if a function is only 1 command, just execute it directly.
@@ -242,24 +499,171 @@ class Namespace:
 
         return line
 
+    # returns the name of the file of <func>, relative to the functions folder and without extension
+    def output_name(self, func, hide):
+
+        if hide and func.path != func.infunc:
+            return '.'.join(func.infunc)[5:] + '/' + func.name[5:]
+        return func.name[5:]
+
+    # replaces calls to functions of at most <threshold> commands with the commands themselves, as long as this adds
+    # no more than <budget> commands to the datapack. A function which is inlined everywhere and isn't one of <roots>
+    # no longer needs a file of its own, which counts towards the budget. Calls made through "execute ... run" get
+    # the execute in front of every command, when the commands can take it, see takes_prefix. Other calls through
+    # execute are left alone, and counted in self.inlineskipped. Recursive functions are never inlined.
+    def inline(self, hide, roots, threshold, budget):
+
+        if threshold < 2:
+            return
+
+        graph = CallGraph(self, [])
+        calls = {}
+        callers = {}
+        for name in self.functions:
+            calls[name] = 'function ' + self.pack + ':' + self.output_name(self.functions[name], hide)
+            callers[name] = set()
+        for name in graph.calls:
+            for callee in graph.calls[name]:
+                callers[callee].add(name)
+
+        roots = set(roots)
+
+        # callees first, so that the body of a function is final by the time it is inlined
+        for component in graph.components():
+
+            name = component[0]
+            func = self.functions[name]
+            size = len(func.commands)
+            if len(component) > 1 or name in graph.calls[name] or size < 2 or size > threshold:
+                continue
+
+            sites = 0
+            kept = name in roots
+            for caller in callers[name]:
+                for command in self.functions[caller].commands:
+                    if command == calls[name]:
+                        sites += 1
+                    elif calls[name] in command and name in graph.callees(command):
+                        prefix = run_prefix(command, calls[name])
+                        if prefix is not None and takes_prefix(prefix, func.commands):
+                            sites += 1
+                            continue
+                        kept = True
+                        if prefix is not None:
+                            self.inlineskipped += 1
+
+            growth = sites * (size - 1) - (0 if kept else size)
+            if sites == 0 or growth > budget:
+                continue
+            budget -= max(growth, 0)
+
+            for caller in callers[name]:
+                commands = []
+                for command in self.functions[caller].commands:
+                    prefix = run_prefix(command, calls[name])
+                    if command == calls[name]:
+                        commands.extend(func.commands)
+                    elif prefix is not None and takes_prefix(prefix, func.commands):
+                        commands.extend(prefix + c for c in func.commands)
+                    else:
+                        commands.append(command)
+                self.functions[caller].commands = commands
+
+                for callee in graph.calls[name]:
+                    callers[callee].add(caller)
+
+            self.inlined += sites
+            self.inlinedcommands += sites * (size - 1)
+
+    # compiles the top-level def <func>, or reuses it from the previous build. Returns the function now registered
+    # under its name.
+    def compile_unit(self, func):
+
+        if self.profiler is not None:
+            previous = self.phase('compile')
+            self.profiler.start_def(func.name)
+
+        if self.cache is None:
+            if not func.instantiable:
+                func.compile()
+        else:
+            func = self.cache.compile_unit(self, func)
+
+        if self.profiler is not None:
+            self.profiler.end_def(func.name)
+            self.phase(previous)
+        return func
+
+    # when profiling, starts the phase <phase> of the build and returns the one which was running, see Profiler
+    def phase(self, phase):
+
+        if self.profiler is not None:
+            return self.profiler.enter(phase)
+        return None
+
+    # when compiling lazily, compiles the top-level def containing the function <name> if it hasn't been yet.
+    def require(self, name):
+
+        unit = self.deferred.pop('.'.join(name.split('.')[:2]), None)
+        if unit is None:
+            return
+
+        defs = list(self.units[unit.name])
+        self.compile_unit(unit)
+
+        # functions generated while compiling are added to the worklist as they are created, but defs already existed
+        if self.worklist is not None:
+            self.worklist.extend(self.functions[f] for f in defs)
+
+    # when compiling lazily, requires the functions called by a plain "function pack:name" in <line>
+    def require_references(self, line):
+
+        call = 'function ' + self.pack + ':'
+        index = line.find(call)
+        while index != -1:
+            name = line[index + len(call):].split(' ', 1)[0]
+            self.require('main.' + name.split('/')[-1])
+            index = line.find(call, index + 1)
+
     def instantiate_string_function(self, funcname, data):
 
         func = self.functions[funcname]
+        self.instancecalls += 1
+
+        data = data.copy()
+        data.update(func.stringdata)
+
+        key = (funcname, tuple(sorted(data.items())))
+        if key in self.instances:
+            return self.instances[key]
+
         newpath = func.path + ['s' + str(func.instancecounter)]
         func.instancecounter += 1
 
+        name = '.'.join(newpath)
+        self.instances[key] = name
+        self.clonedfunctions.append(name)
+
+        previous = self.phase('instantiate')
+
+        if self.cache is not None:
+            if self.cache.restore_clone(self, func, name, data):
+                self.phase(previous)
+                return name
+            self.journal = []
+
         params = {p: func.params[p] for p in func.params if func.params[p] != 's'}
-        
-        data = data.copy()
-        data.update(func.stringdata)
+
         copy = Function(newpath, func.refs, params, func.defaults, func.lines, self,
                         func.pointer, func.expecteddepth, func.infunc, func.inloop, data)
 
         copy.compiledefs()
         copy.compile()
-        self.functions[copy.name] = copy
-
-        self.clonedfunctions.append(copy.name)
+        self.add_function(copy)
 
-        return copy.name
+        if self.cache is not None:
+            self.cache.record_clone(func, name, data, self.journal)
+            self.journal = None
 
+        self.phase(previous)
+        return name
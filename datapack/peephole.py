@@ -0,0 +1,149 @@
+import re
+
+from .commands import *
+
+SCORE = re.compile(r'scoreboard players (set|add|remove) (\S+) (\S+) (-?\d+)$')
+OPERATION = re.compile(r'scoreboard players operation (\S+) (\S+) (\S+) (\S+) (\S+)$')
+TAG = re.compile(r'tag (\S+) (add|remove) (\S+)$')
+
+
+# whether <selector> picks the same entities each time it is used, as long as nothing in between changes them. A
+# predicate may check anything, including the scores and tags the commands around it change.
+def stable(selector):
+    return '@r' not in selector and 'sort=random' not in selector and 'predicate=' not in selector
+
+
+# whether writing a score of <holder> leaves what it picks unchanged: a fake player, or a stable selector which
+# doesn't filter on scores, since writing the score may make it pick different entities the next time
+def fixed(holder):
+    return not holder.startswith('@') or (stable(holder) and 'scores=' not in holder)
+
+
+# the rules below each look at two consecutive commands <a> and <b>. They return the commands to replace both with,
+# or None if they don't apply. Commands run inside an execute are never touched.
+
+
+# merges an add or remove into the set, add or remove of the same score just before it
+def merge_add(a, b):
+
+    ma = SCORE.match(a)
+    mb = SCORE.match(b)
+    if ma is None or mb is None or mb.group(1) == 'set':
+        return None
+    if ma.group(2, 3) != mb.group(2, 3) or not fixed(ma.group(2)):
+        return None
+
+    value = int(mb.group(4)) if mb.group(1) == 'add' else -int(mb.group(4))
+    if ma.group(1) == 'set':
+        return ['scoreboard players set %s %s %i' % (ma.group(2), ma.group(3), wrap(int(ma.group(4)) + value))]
+
+    value += int(ma.group(4)) if ma.group(1) == 'add' else -int(ma.group(4))
+    if value > INT_MAX or -value > INT_MAX:
+        return None
+    # adding 0 is kept, as it still creates the score if it doesn't exist
+    if value >= 0:
+        return ['scoreboard players add %s %s %i' % (ma.group(2), ma.group(3), value)]
+    return ['scoreboard players remove %s %s %i' % (ma.group(2), ma.group(3), -value)]
+
+
+# drops a write to a score which is overwritten right away
+def dead_store(a, b):
+
+    mb = SCORE.match(b)
+    if mb is not None:
+        if mb.group(1) != 'set':
+            return None
+        score = mb.group(2, 3)
+    else:
+        mb = OPERATION.match(b)
+        # another selector for the same objective may still read the score
+        if mb is None or mb.group(3) != '=' or mb.group(2) == mb.group(5):
+            return None
+        score = mb.group(1, 2)
+
+    if not fixed(score[0]):
+        return None
+
+    ma = SCORE.match(a)
+    if ma is not None and ma.group(2, 3) == score:
+        return [b]
+    ma = OPERATION.match(a)
+    # a swap changes the other score as well
+    if ma is not None and ma.group(1, 2) == score and ma.group(3) != '><':
+        return [b]
+    return None
+
+
+# drops a tag which is removed again right away
+def dead_tag(a, b):
+
+    ma = TAG.match(a)
+    mb = TAG.match(b)
+    if ma is None or mb is None or ma.group(2) != 'add' or mb.group(2) != 'remove' or ma.group(3) != mb.group(3):
+        return None
+
+    tag = ma.group(3)
+    if cleared_tag(b) == tag:
+        return [b]
+    # a selector which depends on the tag may pick different entities the second time
+    if mb.group(1) == ma.group(1) and stable(ma.group(1)) and tag not in ma.group(1):
+        return [b]
+    return None
+
+
+# drops the second of two identical kill or tag commands, running them twice has no further effect
+def duplicate(a, b):
+
+    if a != b or not (a.startswith('kill ') or TAG.match(a) is not None):
+        return None
+    # with a limit, the second one may pick entities the first one didn't
+    if not stable(a) or 'limit=' in a:
+        return None
+    return [a]
+
+
+# every rule, in the order they are tried. An entry follows this format: {name : rule}
+RULES = {
+    'merge-add': merge_add,
+    'dead-store': dead_store,
+    'dead-tag': dead_tag,
+    'duplicate': duplicate,
+}
+
+
+# rewrites the commands of functions with the given rules, until none of them applies anymore. Every rule turns two
+# commands into one, so checking each replacement against the command before it reaches that point in one pass.
+class Peephole:
+
+    def __init__(self, rules=tuple(RULES)):
+
+        self.rules = [(name, RULES[name]) for name in RULES if name in rules]
+
+        # the number of times each rule was applied, follows this format: {name : count}
+        self.counts = {name: 0 for name, rule in self.rules}
+
+    # returns <commands> with every rule applied
+    def optimize(self, commands):
+
+        if not self.rules:
+            return commands
+
+        out = []
+        for command in commands:
+            out.append(command)
+            # a replacement may in turn combine with the command before it
+            while len(out) >= 2:
+                for name, rule in self.rules:
+                    replacement = rule(out[-2], out[-1])
+                    if replacement is not None:
+                        break
+                else:
+                    break
+                out[-2:] = replacement
+                self.counts[name] += 1
+
+        return out
+
+    # the number of commands removed
+    def removed(self):
+        return sum(self.counts.values())
@@ -0,0 +1,135 @@
+import json
+import time
+import tracemalloc
+
+# the phases of a build, in the order they run
+PHASES = ('read', 'preprocess', 'compiledefs', 'compile', 'instantiate', 'link', 'optimize', 'prune', 'write')
+
+# how many definitions are listed by default
+PROFILE_TOP = 10
+
+
+# measures where the time and memory of a build go. Exactly one phase runs at a time: entering a phase stops the one
+# before it, so a phase which runs in the middle of another one, like instantiating string functions while linking,
+# isn't counted twice. The time of each top-level def is measured separately, which only takes a clock reading.
+# With <memory>, the peak memory of each phase is measured with tracemalloc, which is only tracing while a phase
+# runs, and slows the build down while it does. The peak is what Python allocated, at most, while the phase ran.
+class Profiler:
+
+    def __init__(self, top=PROFILE_TOP, memory=True):
+
+        # how many definitions to list
+        self.top = top
+
+        # whether to measure memory, and whether tracemalloc was started for it, so that it is stopped again
+        self.memory = memory
+        self.tracing = False
+
+        # an entry follows this format: {phase : [seconds, peak memory of any of its runs, or None]}
+        self.phases = {}
+
+        # the phase running right now, and since when
+        self.current = None
+        self.started = None
+
+        # an entry follows this format: {top-level Function.name : seconds}
+        self.defs = {}
+        self.defstarted = {}
+
+        # the number of functions generated for each top-level def, follows this format: {Function.name : count}
+        self.functions = {}
+
+    # starts the phase <phase>, stopping the one running. None stops without starting another one. Returns the phase
+    # which was running, so that it can be resumed.
+    def enter(self, phase):
+
+        now = time.perf_counter()
+        previous = self.current
+        if previous is not None:
+            entry = self.phases.setdefault(previous, [0.0, None])
+            entry[0] += now - self.started
+            if self.memory:
+                entry[1] = max(entry[1] or 0, tracemalloc.get_traced_memory()[1])
+
+        if self.memory:
+            if phase is not None and not tracemalloc.is_tracing():
+                tracemalloc.start()
+                self.tracing = True
+            elif phase is None and self.tracing:
+                tracemalloc.stop()
+                self.tracing = False
+            if phase is not None:
+                tracemalloc.reset_peak()
+
+        self.current = phase
+        # started last, so that starting tracemalloc isn't counted
+        self.started = time.perf_counter()
+        return previous
+
+    def stop(self):
+        self.enter(None)
+
+    def start_def(self, name):
+        self.defstarted[name] = time.perf_counter()
+
+    def end_def(self, name):
+        self.defs[name] = self.defs.get(name, 0.0) + time.perf_counter() - self.defstarted.pop(name)
+
+    # records the functions generated for each def, from Namespace.units
+    def count_functions(self, units):
+        self.functions = {name: len(functions) for name, functions in units.items()}
+
+    def total(self):
+        return sum(entry[0] for entry in self.phases.values())
+
+    # returns (phase, seconds, peak memory) for every phase which ran, in the order of PHASES
+    def timings(self):
+        return [(phase,) + tuple(self.phases[phase]) for phase in PHASES if phase in self.phases]
+
+    # returns the <top> slowest defs, and the <top> defs which generated the most functions, as lists of
+    # (name, seconds, functions)
+    def ranking(self):
+
+        names = set(name for name in list(self.defs) + list(self.functions) if name.startswith('main.'))
+        rows = [(name, self.defs.get(name, 0.0), self.functions.get(name, 0)) for name in names]
+        slowest = sorted(rows, key=lambda row: (-row[1], row[0]))[:self.top]
+        largest = sorted(rows, key=lambda row: (-row[2], row[0]))[:self.top]
+        return slowest, largest
+
+    def to_text(self):
+
+        out = ['\nprofile:', '']
+        if self.memory:
+            out.append('\t%-12s %10s%13s' % ('phase', 'time', 'peak memory'))
+        for phase, seconds, memory in self.timings():
+            memory = '' if memory is None else '%10.1f MB' % (memory / 2 ** 20)
+            out.append('\t%-12s %8.3f s%s' % (phase, seconds, memory))
+        out.append('\t%-12s %8.3f s' % ('total', self.total()))
+
+        slowest, largest = self.ranking()
+        if slowest:
+            out.extend(['', 'slowest definitions:', ''])
+            out.extend('\t%8.3f s  %s' % (seconds, name[5:]) for name, seconds, functions in slowest)
+            out.extend(['', 'most generated functions:', ''])
+            out.extend('\t%8i    %s' % (functions, name[5:]) for name, seconds, functions in largest)
+        return '\n'.join(out) + '\n'
+
+    def to_json(self):
+
+        slowest, largest = self.ranking()
+        profile = {
+            'phases': [{'name': phase, 'seconds': seconds, 'peak_memory': memory}
+                       for phase, seconds, memory in self.timings()],
+            'total_seconds': self.total(),
+            'slowest': [{'name': name[5:], 'seconds': seconds, 'functions': functions}
+                        for name, seconds, functions in slowest],
+            'most_functions': [{'name': name[5:], 'seconds': seconds, 'functions': functions}
+                               for name, seconds, functions in largest],
+        }
+        return json.dumps(profile, indent=4) + '\n'
+
+    # writes the profile to <path> as JSON
+    def write(self, path):
+
+        with open(path, 'w') as f:
+            f.write(self.to_json())
@@ -1,69 +1,147 @@
-# return a list of all the individual tokens in a string.
-def tokenize(line):
+import re
+
+# token kinds produced by lex()
+NAME = 'name'          # an identifier, optionally followed by clarifiers, e.g. player#p
+NUMBER = 'number'      # a run of digits
+OPERATOR = 'operator'  # one of the operator characters, or a compound operator such as += or ==
+STRING = 'string'      # a quoted string, including its quotes
+OPEN = 'open'          # [ or {, opening a bracket group
+CLOSE = 'close'        # ] or }, closing a bracket group
+
+_pattern = re.compile(r'''
+    (?P<space>\s+)
+  | (?P<string>"(?:\\.|[^"\\])*"|'(?:\\.|[^'\\])*')
+  | (?P<unterminated>["'].*)
+  | (?P<operator>\+=|-=|\*=|/=|%=|==|<=|>=|><|\+\+|--|[=,:+\-*<>%\\/()])
+  | (?P<open>[\[{])
+  | (?P<close>[\]}])
+  | (?P<word>[^\s"'=,{}\[\]():+\-*<>%\\/]+)
+''', re.VERBOSE)
+
+
+class Token:
+
+    __slots__ = ('kind', 'text', 'start', 'end', 'depth', 'space', 'value', 'clarifiers')
+
+    def __init__(self, kind, text, start, end, depth):
+
+        self.kind = kind
+        self.text = text
+
+        # offsets of this token in the line it was read from
+        self.start = start
+        self.end = end
+
+        # bracket nesting depth. an opening bracket and its closing bracket share the depth outside of the group.
+        self.depth = depth
+
+        # the whitespace which follows this token, if any
+        self.space = ''
+
+        # for names, the part before the '#' and the clarifiers after it (None if there is no '#').
+        # for strings, value holds the content between the quotes.
+        self.value = text
+        self.clarifiers = None
+
+    def __repr__(self):
+        return 'Token(%s, %r, %i)' % (self.kind, self.text, self.start)
+
+    # whether the whitespace following this token separates two arguments
+    def splits(self):
+        return self.space != '' and self.depth == 0 and self.kind != OPEN
+
+
+# scan a line once, returning a list of Tokens.
+def lex(line):
     tokens = []
-    buff = ''
-    squote, dquote = False, False
+    depth = 0
 
-    for ch in line:
-        if ch == '"' and not squote:
-            if len(buff) > 0:
-                tokens.append(buff)
-            tokens.append(ch)
-            buff = ''
-            dquote = not dquote
-        elif ch == '\'' and not dquote:
-            if len(buff) > 0:
-                tokens.append(buff)
-            tokens.append(ch)
-            buff = ''
-            squote = not squote
-        elif squote or dquote:
-            buff += ch
+    for match in _pattern.finditer(line):
+        kind = match.lastgroup
+        text = match.group()
+
+        if kind == 'space':
+            if tokens:
+                tokens[-1].space = text
             continue
-        elif ch in '=,{}[]():+-*<>%\\/':
-            if len(buff) > 0:
-                tokens.append(buff)
-            tokens.append(ch)
-            buff = ''
-        elif ch in ' 0123456789':
-            buff += ch
-            if len(buff) > 0:
-                tokens.append(buff)
-            buff = ''
+
+        if kind == 'open':
+            token = Token(OPEN, text, match.start(), match.end(), depth)
+            depth += 1
+        elif kind == 'close':
+            depth -= 1
+            token = Token(CLOSE, text, match.start(), match.end(), depth)
+        elif kind == 'word':
+            token = Token(NUMBER if text.isdigit() else NAME, text, match.start(), match.end(), depth)
+            if '#' in text:
+                token.value, _, token.clarifiers = text.partition('#')
+        elif kind == 'string':
+            token = Token(STRING, text, match.start(), match.end(), depth)
+            token.value = text[1:-1]
+        elif kind == 'unterminated':  # a string which runs to the end of the line
+            token = Token(STRING, text, match.start(), match.end(), depth)
+            token.value = text[1:]
         else:
-            buff += ch
+            token = Token(OPERATOR, text, match.start(), match.end(), depth)
+
+        tokens.append(token)
 
-    if len(buff) > 0:
-        tokens.append(buff)
     return tokens
 
 
-# returns a list of the separate arguments in a string
-def broad_tokenize(line):
-    tokens = tokenize(line)
+# caches the tokens of source lines for the duration of a build, so that the preprocessor, the compiler and every
+# clone of a string function share a single lexing pass. entries are keyed by line number and content.
+class LineCache:
 
-    stack, token, depth, squote, dquote = [], '', 0, False, False
+    def __init__(self, lexer=lex):
 
-    for subtoken in tokens:
-        token += subtoken
+        # the function used to lex lines which aren't cached yet
+        self.lexer = lexer
 
-        if subtoken == '"' and not squote:
-            dquote = not dquote
-        if subtoken == '\'' and not dquote:
-            squote = not squote
-        elif subtoken in '[{':
-            depth += 1
-        elif subtoken in ']}':
-            depth -= 1
+        self.entries = {}
+        self.hits = 0
+        self.misses = 0
+
+    # returns the tokens of <line>. the returned list is shared, and must not be modified.
+    def tokens(self, line, index=None):
+
+        key = (index, line)
+        tokens = self.entries.get(key)
+        if tokens is None:
+            self.misses += 1
+            tokens = self.entries[key] = self.lexer(line)
+        else:
+            self.hits += 1
+        return tokens
+
+    # stores already lexed <tokens> for <line>
+    def store(self, line, index, tokens):
+
+        self.misses += 1
+        self.entries[(index, line)] = tokens
+
+
+# groups a list of tokens into arguments, which are separated by whitespace outside of brackets and quotes.
+def split_arguments(tokens):
+    args = []
+    arg = []
+
+    for token in tokens:
+        arg.append(token)
+        if token.splits():
+            args.append(arg)
+            arg = []
+
+    if arg:
+        args.append(arg)
+    return args
 
-        if depth == 0 and not squote and not dquote and token[-1] == ' ':
-            if len(token.strip()) > 0:
-                stack.append(token.strip())
-                token = ''
 
-    if len(token) > 0:
-        stack.append(token)
-    return stack
+# returns the source text spanned by a list of tokens
+def join_tokens(tokens):
+    if not tokens:
+        return ''
+    return ''.join(t.text + t.space for t in tokens[:-1]) + tokens[-1].text
 
 
 # return the level of indentation of the line
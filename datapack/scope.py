@@ -0,0 +1,108 @@
+# symbol tables for resolving bare names against the enclosing scopes of a function.
+
+
+# returns every scope enclosing <path>, innermost first. e.g. ['main', 'load', 'e0'] -> ('main.load.e0', 'main.load', 'main')
+def scope_chain(path):
+    return tuple('.'.join(path[:i]) for i in range(len(path), 0, -1))
+
+
+class ScopeIndex:
+
+    def __init__(self):
+
+        # an entry follows this format: {name : {scope : path}}, where path == scope + '.' + name.
+        # a path is indexed under every one of its prefixes, so dotted names like "kit.food" resolve as well.
+        self.names = {}
+
+    # returns the entry for <name>, which may be modified.
+    def entry(self, name):
+
+        entry = self.names.get(name)
+        if entry is None:
+            entry = self.names[name] = {}
+        return entry
+
+    def add(self, path):
+
+        index = path.find('.')
+        while index != -1:
+            self.entry(path[index + 1:])[path[:index]] = path
+            index = path.find('.', index + 1)
+
+    def remove(self, path):
+
+        index = path.find('.')
+        while index != -1:
+            name = path[index + 1:]
+            entry = self.entry(name)
+            entry.pop(path[:index], None)
+            if not entry:
+                self.names.pop(name)
+            index = path.find('.', index + 1)
+
+    # return the path of <name> in the innermost scope of <chain> which declares it, or None.
+    def resolve(self, name, chain):
+
+        entry = self.names.get(name)
+        if entry is not None:
+            for scope in chain:
+                path = entry.get(scope)
+                if path is not None:
+                    return path
+        return None
+
+
+# the references visible to a function, mapping each full reference path to its type.
+# copies share their tables with the original until either one of them is written to.
+class SymbolTable(ScopeIndex):
+
+    def __init__(self):
+
+        ScopeIndex.__init__(self)
+        self.types = {}
+        self.shared = False
+
+        # names whose entries belong to this table alone, and may be modified in place
+        self.owned = set()
+
+    def copy(self):
+
+        other = SymbolTable()
+        other.names = self.names
+        other.types = self.types
+        other.shared = self.shared = True
+        self.owned = set()
+        return other
+
+    def entry(self, name):
+
+        if name in self.owned:
+            return self.names[name]
+        self.owned.add(name)
+        entry = self.names[name] = dict(self.names.get(name, ()))
+        return entry
+
+    def __contains__(self, path):
+        return path in self.types
+
+    def __getitem__(self, path):
+        return self.types[path]
+
+    def __setitem__(self, path, type):
+
+        if self.shared:
+            self.names = self.names.copy()
+            self.types = self.types.copy()
+            self.shared = False
+
+        if path not in self.types:
+            self.add(path)
+        self.types[path] = type
+
+    def update(self, other):
+
+        if other.types is self.types:
+            return
+        for path, type in other.types.items():
+            if self.types.get(path) != type:
+                self[path] = type
@@ -0,0 +1,134 @@
+import re
+
+from .commands import *
+
+# anything which could be the name of an objective
+NAME = re.compile(r'[\w.+-]+')
+
+# commands which may run other functions before they return
+CALLS = ('function ', 'advancement ')
+
+
+# shares objectives between integer variables whose values are never alive at the same time.
+#
+# an objective is only considered if, in every function, each use of it comes after a plain "set" or "=" to it,
+# with no call to another function in between. Its value then never outlives a stretch of straight-line commands
+# in one function, and no other function runs while it is alive. Within each function, such objectives whose
+# stretches don't overlap are given the same slot. This mostly applies to .TEST temporaries and to variables local
+# to a single block; parameters, globals and variables used by loops are left alone.
+class SlotAllocator:
+
+    def __init__(self, namespace, objectives):
+
+        self.namespace = namespace
+
+        holder = re.escape(score_holder(namespace))
+        self.define = re.compile(r'scoreboard players set ' + holder + r' ([\w.+-]+) -?\d+$')
+        self.copy = re.compile(r'scoreboard players operation ' + holder + r' ([\w.+-]+) = ' + holder +
+                               r' ([\w.+-]+)$')
+
+        # the objectives to allocate, in order
+        self.objectives = list(dict.fromkeys(objectives))
+        candidates = set(self.objectives)
+
+        # an entry follows this format: {objective : [(function name, first command, last command), ...]}
+        self.ranges = {o: [] for o in self.objectives}
+        unsafe = set()
+
+        for name, func in namespace.functions.items():
+            alive = {}
+            for i, command in enumerate(func.commands):
+
+                if command.startswith('#'):
+                    continue
+
+                defined = self.defined(command)
+                for match in NAME.finditer(command):
+                    o = match.group(0)
+                    if o not in candidates or o == defined:
+                        continue
+                    if o in alive:
+                        alive[o][1] = i
+                    else:
+                        unsafe.add(o)
+
+                if any(c in command for c in CALLS):
+                    for o in alive:
+                        self.ranges[o].append((name, alive[o][0], alive[o][1]))
+                    alive = {}
+
+                if defined in candidates:
+                    if defined in alive:
+                        self.ranges[defined].append((name, alive[defined][0], alive[defined][1]))
+                    alive[defined] = [i, i]
+
+            for o in alive:
+                self.ranges[o].append((name, alive[o][0], alive[o][1]))
+
+        # objectives which no command uses don't need a slot at all
+        self.unused = [o for o in self.objectives if o not in unsafe and not self.ranges[o]]
+        self.objectives = [o for o in self.objectives if o not in unsafe and self.ranges[o]]
+
+        # an entry follows this format: {objective : slot}, for objectives which share their slot
+        self.slots = {}
+
+    # returns the objective which <command> sets without reading it first, or None
+    def defined(self, command):
+
+        match = self.define.match(command)
+        if match is not None:
+            return match.group(1)
+        match = self.copy.match(command)
+        if match is not None and match.group(1) != match.group(2):
+            return match.group(1)
+        return None
+
+    # assigns every objective a slot, reusing the slot of an earlier objective when their ranges never overlap.
+    # slots shared by several objectives are named SLOT.<n>, the others keep their objective. Returns the mapping
+    # from objective to slot for the objectives which were renamed.
+    def allocate(self):
+
+        # objectives which are alive at the same time in some function, follows this format: {objective : set}
+        conflicts = {o: set() for o in self.objectives}
+        byfunction = {}
+        for o in self.objectives:
+            for name, start, end in self.ranges[o]:
+                byfunction.setdefault(name, []).append((start, end, o))
+
+        for ranges in byfunction.values():
+            ranges.sort()
+            active = []
+            for start, end, o in ranges:
+                active = [r for r in active if r[0] >= start]
+                for other in active:
+                    if other[1] != o:
+                        conflicts[o].add(other[1])
+                        conflicts[other[1]].add(o)
+                active.append((end, o))
+
+        members = []
+        for o in self.objectives:
+            for slot in members:
+                if not any(m in conflicts[o] for m in slot):
+                    slot.append(o)
+                    break
+            else:
+                members.append([o])
+
+        taken = set(self.namespace.intmap.values())
+        n = 0
+        for slot in members:
+            if len(slot) < 2:
+                continue
+            while 'SLOT.%i' % n in taken:
+                n += 1
+            for o in slot:
+                self.slots[o] = 'SLOT.%i' % n
+            n += 1
+
+        return self.slots
+
+    # returns <command> with every objective replaced by its slot
+    def rename(self, command):
+
+        return NAME.sub(lambda match: self.slots.get(match.group(0), match.group(0)), command)
@@ -0,0 +1,163 @@
+import ctypes
+import ctypes.util
+import os
+import select
+import sys
+import time
+
+# flags from <sys/inotify.h>
+IN_ATTRIB = 0x00000004
+IN_CLOSE_WRITE = 0x00000008
+IN_MOVED_FROM = 0x00000040
+IN_MOVED_TO = 0x00000080
+IN_CREATE = 0x00000100
+IN_DELETE = 0x00000200
+IN_DELETE_SELF = 0x00000400
+IN_MOVE_SELF = 0x00000800
+IN_NONBLOCK = os.O_NONBLOCK
+IN_CLOEXEC = 0o2000000
+
+# IN_MODIFY is left out on purpose, saves are reported once by IN_CLOSE_WRITE instead of once per write
+WATCH_MASK = IN_ATTRIB | IN_CLOSE_WRITE | IN_MOVED_FROM | IN_MOVED_TO | IN_CREATE | IN_DELETE | IN_DELETE_SELF | IN_MOVE_SELF
+
+
+# returns something which changes whenever the file or directory at <path> does, or None if it doesn't exist.
+def stamp(path):
+
+    try:
+        st = os.stat(path)
+    except OSError:
+        return None
+    return (st.st_mtime_ns, st.st_size, st.st_ino)
+
+
+# returns the stamp of every path in <paths>, follows this format: {path : stamp}
+def stamp_all(paths):
+
+    return {p: stamp(p) for p in paths}
+
+
+# waits for changes to a set of files by checking their stamps every <interval> seconds. Paths which don't exist
+# yet, or no longer exist, can be watched as well.
+class PollingWatcher:
+
+    def __init__(self, debounce=0.1, interval=0.5):
+
+        # how long the files must stay unchanged before a burst of saves is reported
+        self.debounce = debounce
+        self.interval = interval
+
+        # the last seen stamp of every watched path
+        self.stamps = {}
+
+    # starts watching <paths>, replacing the previously watched ones. <stamps> are the stamps of any paths which
+    # were taken before the latest build, so that changes made while it ran are not missed.
+    def watch(self, paths, stamps=None):
+
+        stamps = stamps or {}
+        self.stamps = {p: stamps[p] if p in stamps else stamp(p) for p in paths}
+
+    # blocks until something may have changed
+    def block(self):
+
+        time.sleep(self.interval)
+
+    # blocks until at least one watched path changed, and none changed for self.debounce seconds.
+    # returns the paths which changed, in sorted order.
+    def wait(self):
+
+        current = stamp_all(self.stamps)
+        while current == self.stamps:
+            self.block()
+            current = stamp_all(self.stamps)
+
+        while True:
+            time.sleep(self.debounce)
+            later = stamp_all(self.stamps)
+            if later == current:
+                break
+            current = later
+
+        changed = sorted(p for p in current if current[p] != self.stamps[p])
+        self.stamps = current
+        return changed
+
+    def close(self):
+        pass
+
+
+# waits for changes to a set of files using the Linux inotify API. The directories containing the files are watched
+# rather than the files themselves, so that editors which save by replacing a file are handled.
+# paths in directories which can't be watched are polled instead.
+class InotifyWatcher(PollingWatcher):
+
+    def __init__(self, debounce=0.1, interval=0.5):
+
+        PollingWatcher.__init__(self, debounce, interval)
+
+        self.libc = ctypes.CDLL(ctypes.util.find_library('c') or 'libc.so.6', use_errno=True)
+        self.fd = self.libc.inotify_init1(IN_NONBLOCK | IN_CLOEXEC)
+        if self.fd < 0:
+            raise OSError(ctypes.get_errno(), 'inotify_init1 failed')
+
+        # an entry follows this format: {directory : watch descriptor}
+        self.directories = {}
+
+        # whether some path has to be polled, because its directory couldn't be watched
+        self.polling = False
+
+    def watch(self, paths, stamps=None):
+
+        PollingWatcher.watch(self, paths, stamps)
+
+        directories = set()
+        for p in self.stamps:
+            directories.add(p if os.path.isdir(p) else os.path.dirname(p))
+
+        for d in list(self.directories):
+            if d not in directories:
+                self.libc.inotify_rm_watch(self.fd, self.directories.pop(d))
+
+        # a watch disappears along with its directory, so every directory is added again
+        self.polling = False
+        for d in directories:
+            wd = self.libc.inotify_add_watch(self.fd, os.fsencode(d), WATCH_MASK)
+            if wd < 0:
+                self.directories.pop(d, None)
+                self.polling = True
+            else:
+                self.directories[d] = wd
+
+    def block(self):
+
+        timeout = self.interval if self.polling else None
+        ready, _, _ = select.select([self.fd], [], [], timeout)
+        if ready:
+            self.drain()
+
+    # reads and discards all pending events, they are only used to wake up
+    def drain(self):
+
+        while True:
+            try:
+                if not os.read(self.fd, 4096):
+                    return
+            except BlockingIOError:
+                return
+
+    def close(self):
+
+        if self.fd >= 0:
+            os.close(self.fd)
+            self.fd = -1
+
+
+# returns the best available watcher for this platform
+def create_watcher(debounce=0.1):
+
+    if sys.platform.startswith('linux'):
+        try:
+            return InotifyWatcher(debounce)
+        except (OSError, AttributeError):
+            pass
+    return PollingWatcher(debounce)
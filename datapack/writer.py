@@ -0,0 +1,233 @@
+import hashlib
+import json
+import os
+import posixpath
+import time
+import zipfile
+from concurrent.futures import ThreadPoolExecutor
+
+# stores what the previous build wrote, relative to the root of the datapack. It is kept next to the datapack
+# folder rather than in it, so that it isn't shipped with the datapack: the manifest of the folder <name> is
+# .<name>.manifest.json. Older builds wrote it to this file inside the datapack, which is removed.
+MANIFEST = '.%s.manifest.json'
+OLD_MANIFEST = '.datapack-manifest.json'
+
+# the number of files each writing thread takes at a time
+BATCH_SIZE = 64
+
+# the timestamp of every entry of a zipped datapack, so that identical builds give identical archives
+ZIP_DATE = (1980, 1, 1, 0, 0, 0)
+
+
+def digest(data):
+    return hashlib.sha1(data).hexdigest()
+
+
+# whether the relative path <path> is inside the folder it is relative to
+def inside(path):
+
+    path = posixpath.normpath(path)
+    return not (path == '..' or path.startswith('../') or posixpath.isabs(path))
+
+
+# writes the files of a datapack, skipping files whose content is the same as in the previous build and removing
+# files which the previous build wrote but this one didn't. What was written is recorded in a manifest, which
+# follows this format: {path : sha1 of content}, where path is relative to the root and always uses '/'. Files
+# copied outside of the root are written, but never recorded, so they are never deleted either.
+class Writer:
+
+    def __init__(self, root, generated=()):
+
+        self.root = root
+        folder = os.path.normpath(os.path.abspath(root))
+        self.manifestpath = os.path.join(os.path.dirname(folder), MANIFEST % os.path.basename(folder))
+
+        # an entry follows this format: {path : content}
+        self.files = {}
+
+        # an entry follows this format: {path : source path}, for files which are copied rather than generated
+        self.copies = {}
+
+        self.written = 0
+        self.unchanged = 0
+        self.deleted = 0
+
+        # seconds spent writing, set by finish
+        self.elapsed = 0
+
+        # the number of files put in the zip archive and the seconds it took, set by archive
+        self.zipped = 0
+        self.zipelapsed = 0
+
+        self.manifest = self.read_manifest()
+
+        # without a manifest, whatever is in the <generated> folders is assumed to come from an earlier build
+        if self.manifest is None:
+            self.manifest = {}
+            for folder in generated:
+                for dirpath, dirnames, filenames in os.walk(os.path.join(root, *folder.split('/'))):
+                    for f in filenames:
+                        if f.endswith('.mcfunction'):
+                            self.manifest[self.relative(os.path.join(dirpath, f))] = None
+
+    def read_manifest(self):
+
+        for path in (self.manifestpath, os.path.join(self.root, OLD_MANIFEST)):
+            try:
+                with open(path, 'r') as f:
+                    manifest = json.load(f)
+            except (OSError, ValueError):
+                continue
+            if isinstance(manifest, dict):
+                return {path: h for path, h in manifest.items() if inside(path)}
+        return None
+
+    def relative(self, path):
+        return os.path.relpath(path, self.root).replace(os.sep, '/')
+
+    def absolute(self, path):
+        return os.path.join(self.root, *path.split('/'))
+
+    # returns the digest of the file at <target>, or None if it can't be read
+    def disk_digest(self, target):
+
+        try:
+            with open(target, 'rb') as f:
+                return digest(f.read())
+        except OSError:
+            return None
+
+    # queues <content> to be written to <path>
+    def write(self, path, content):
+        self.files[path] = content.encode('utf-8')
+
+    # queues <source> to be copied to <path>
+    def copy(self, source, path):
+        self.copies[path] = source
+
+    # writes <data> to <path> unless the previous build already wrote the same data there. The folder of <path>
+    # must already exist. Returns the digest of <data> and whether the file was written.
+    def store(self, path, data):
+
+        h = digest(data)
+        target = self.absolute(path)
+        known = self.manifest.get(path)
+        if known is None:  # not written by the previous build, but it may still be there from an older one
+            known = self.disk_digest(target)
+        if known == h and os.path.isfile(target):
+            return h, False
+
+        with open(target, 'wb') as f:
+            f.write(data)
+        return h, True
+
+    # like store, for a file copied from <source>
+    def store_copy(self, path, source):
+
+        with open(source, 'rb') as f:
+            return self.store(path, f.read())
+
+    # runs a list of (store or store_copy, path, argument) tasks, returns their results
+    def run_batch(self, tasks):
+        return [task(path, argument) for task, path, argument in tasks]
+
+    # writes every queued file, deletes stale ones and saves the new manifest. Files are written by a pool of
+    # <jobs> threads, or serially if <jobs> is 1. Returns the paths of the copied files which had to be written.
+    def finish(self, jobs=None):
+
+        start = time.perf_counter()
+
+        # create every folder once, up front
+        folders = set(os.path.dirname(path) for path in self.files)
+        folders.update(os.path.dirname(path) for path in self.copies)
+        for folder in sorted(folders):
+            os.makedirs(self.absolute(folder), exist_ok=True)
+
+        tasks = [(self.store, path, data) for path, data in self.files.items()]
+        tasks += [(self.store_copy, path, source) for path, source in self.copies.items()]
+        paths = [task[1] for task in tasks]
+
+        if jobs == 1:
+            results = self.run_batch(tasks)
+        else:
+            # small files are handed out in batches, one task per file costs more than the write itself
+            batches = [tasks[i:i + BATCH_SIZE] for i in range(0, len(tasks), BATCH_SIZE)]
+            results = []
+            with ThreadPoolExecutor(jobs) as pool:
+                for batch in pool.map(self.run_batch, batches):
+                    results += batch
+
+        manifest = {}
+        copied = []
+        for path, (h, written) in zip(paths, results):
+            if inside(path):
+                manifest[path] = h
+            if written:
+                self.written += 1
+                if path in self.copies:
+                    copied.append(path)
+            else:
+                self.unchanged += 1
+
+        for path in self.manifest:
+            if path not in manifest:
+                self.delete(path)
+
+        with open(self.manifestpath, 'w') as f:
+            json.dump(manifest, f, indent=0, sort_keys=True)
+        try:
+            os.remove(os.path.join(self.root, OLD_MANIFEST))
+        except FileNotFoundError:
+            pass
+
+        self.manifest = manifest
+        self.elapsed = time.perf_counter() - start
+        return copied
+
+    # writes every queued file into the zip archive <target> straight from memory, in sorted order and with fixed
+    # timestamps. <level> is the deflate compression level: 0 stores files uncompressed, None uses zlib's default.
+    # files which would end up outside of the datapack are left out.
+    def archive(self, target, level=None):
+
+        start = time.perf_counter()
+
+        entries = dict(self.files)
+        for path, source in self.copies.items():
+            with open(source, 'rb') as f:
+                entries[path] = f.read()
+
+        os.makedirs(os.path.dirname(target), exist_ok=True)
+        temp = target + '.tmp'
+        with zipfile.ZipFile(temp, 'w') as z:
+            for path in sorted(entries):
+                if not inside(path):
+                    continue
+                info = zipfile.ZipInfo(path, ZIP_DATE)
+                info.create_system = 3
+                info.external_attr = 0o644 << 16
+                info.compress_type = zipfile.ZIP_STORED if level == 0 else zipfile.ZIP_DEFLATED
+                z.writestr(info, entries[path], compresslevel=level)
+        os.replace(temp, target)
+
+        self.zipped = len(z.infolist())
+        self.zipelapsed = time.perf_counter() - start
+
+    # deletes the file at <path>, along with any folders this leaves empty. Paths outside of the root are left alone.
+    def delete(self, path):
+
+        if not inside(path):
+            return
+        target = self.absolute(path)
+        try:
+            os.remove(target)
+        except FileNotFoundError:
+            return
+        self.deleted += 1
+
+        folder = os.path.dirname(target)
+        while folder != self.root and folder.startswith(self.root):
+            try:
+                os.rmdir(folder)
+            except OSError:
+                break
+            folder = os.path.dirname(folder)